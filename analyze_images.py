@@ -1,63 +1,202 @@
 import os
-import json
+import re
+import orjson
 import base64
-import requests
-import time
+import hashlib
+import io
+import asyncio
+import aiohttp
+import multiprocessing
+from PIL import Image
+from json_repair import repair_json
 
 INVENTORY_FILE = "epstein_files/inventory.json"
 LM_STUDIO_URL = "http://127.0.0.1:1234/v1/chat/completions"
 #LM_STUDIO_URL = "http://192.168.7.142:1234/v1/chat/completions"
 MODEL = "mistralai/ministral-3-3b"
+MAX_CONCURRENCY = 5 # In-flight LLM requests; LM Studio queues the rest on the GPU anyway
+CACHE_DIR = ".cache/llm_responses" # Raw model responses keyed by image sha256 + model + prompt
+
+ENCODE_CHUNK_SIZE = 57 * 1024 # Multiple of 3 so each chunk base64-encodes without padding
+MAX_EDGE = 1024 # The vision tower gains nothing above this; larger images only cost prefill time
+RESIZED_DIR = ".cache/llm_input" # Downscaled copies keyed by source sha256, outside epstein_files so no step treats them as images
+URLS_PER_CHUNK = 20 # Documents handed to a worker process at a time
+FLUSH_EVERY = 50 # Inventory updates buffered before rewriting inventory.json
+CHECKPOINT_FILE = "epstein_files/analyzed.set" # One analyzed image path per line, appended as we go
+
+_pending_updates = 0
+_analyzed = set()
+_checkpoint = None
+
+PROMPT = (
+    "Analyze this image and provide a structured analysis in JSON format.\n"
+    "Return a single Valid JSON object with the following keys:\n"
+    "- \"type\": one of [\"document\", \"photograph\", \"logo\", \"diagram\", \"other\", \"empty\"]\n"
+    "- \"objects_detected\": list of strings (names of key objects found, empty if none)\n"
+    "- \"needs_ocr\": boolean (true if significant text is visible that needs extraction)\n"
+    "- \"is_empty\": boolean (true if the image is blank, solid color, or noise)\n"
+    "- \"is_photo\": boolean (true if the image is a photograph of people/places, NOT a scanned document)\n"
+    "- \"is_blacked_out\": boolean (true if the image is significantly redacted or blacked out)\n"
+    "- \"inappropriate\": boolean (true if the image depicts inappropriate content, specifically older individuals interacting with children)\n"
+    "- \"rotation_correction\": integer (0, 90, 180, or 270 - degrees to rotate CLOCKWISE to correct orientation)\n"
+    "- \"description\": string (a detailed visual description of the content)\n"
+    "\nExample Output:\n"
+    "{\n"
+    "  \"type\": \"document\",\n"
+    "  \"objects_detected\": [],\n"
+    "  \"needs_ocr\": true,\n"
+    "  \"is_empty\": false,\n"
+    "  \"is_photo\": false,\n"
+    "  \"is_blacked_out\": false,\n"
+    "  \"inappropriate\": false,\n"
+    "  \"rotation_correction\": 0,\n"
+    "  \"description\": \"A scanned letter with handwritten signatures.\"\n"
+    "}"
+)
+
+# Part of the response cache key, so editing the prompt doesn't serve answers to the old one
+PROMPT_HASH = hashlib.sha256(PROMPT.encode('utf-8')).hexdigest()[:16]
+
+# Response parsing patterns, compiled once rather than per image
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_BRACE_SPAN_RE = re.compile(r'\{.*\}', re.DOTALL)
 
 def load_inventory():
     try:
         if not os.path.exists(INVENTORY_FILE):
             return {}
-        with open(INVENTORY_FILE, 'r') as f:
-            return json.load(f)
+        with open(INVENTORY_FILE, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception:
         return {}
 
-def update_item(url, data):
-    inv = load_inventory()
-    if url in inv:
-        inv[url].update(data)
-        with open(INVENTORY_FILE, 'w') as f:
-            json.dump(inv, f, indent=2)
+def write_json_atomic(path, obj):
+    # Compact bytes to a per-process temp file, then rename: a killed run never leaves a
+    # truncated file behind, and two workers writing the same path can't interleave
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(obj))
+    os.replace(tmp_path, path)
+
+def flush_inventory(inventory):
+    global _pending_updates
+    write_json_atomic(INVENTORY_FILE, inventory)
+    _pending_updates = 0
+
+def update_item(inventory, url, data):
+    global _pending_updates
+    if url in inventory:
+        inventory[url].update(data)
+        _pending_updates += 1
+        if _pending_updates >= FLUSH_EVERY:
+            flush_inventory(inventory)
+
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            return set(f.read().splitlines())
+    except OSError:
+        return set()
+
+def record_checkpoint(img_path):
+    # fsync per line so a crash never loses an analysis that is already on disk
+    if img_path in _analyzed or _checkpoint is None:
+        return
+    _analyzed.add(img_path)
+    _checkpoint.write(img_path + "\n")
+    _checkpoint.flush()
+    os.fsync(_checkpoint.fileno())
+
+def encode_file(path, digest=None):
+    # Encode chunk by chunk so the raw file and its base64 copy are never both held in full
+    encoded = io.BytesIO()
+    with open(path, "rb") as f:
+        while chunk := f.read(ENCODE_CHUNK_SIZE):
+            if digest is not None:
+                digest.update(chunk)
+            encoded.write(base64.b64encode(chunk))
+    return encoded.getvalue().decode('ascii')
+
+def downscale_image(image_path, image_hash):
+    """
+    Returns the path to send to the model: a cached Lanczos-downscaled JPEG
+    if the image exceeds MAX_EDGE, otherwise the original.
+    """
+    resized_path = os.path.join(RESIZED_DIR, f"{image_hash}.jpg")
+    if os.path.exists(resized_path):
+        return resized_path
+    try:
+        with Image.open(image_path) as img:
+            if max(img.size) <= MAX_EDGE:
+                return image_path
+            img.thumbnail((MAX_EDGE, MAX_EDGE), Image.Resampling.LANCZOS)
+            os.makedirs(RESIZED_DIR, exist_ok=True)
+            tmp_path = f"{resized_path}.{os.getpid()}.tmp"
+            img.convert("RGB").save(tmp_path, "JPEG", quality=85)
+            os.replace(tmp_path, resized_path)
+            return resized_path
+    except Exception as e:
+        print(f"Warning: Could not downscale {image_path}, sending original: {e}")
+        return image_path
 
 def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    """
+    Returns (sha256 hex digest of the original file, base64 string of the image to send).
+    """
+    digest = hashlib.sha256()
+    try:
+        # Header only; images that go as-is are hashed and encoded in a single read
+        with Image.open(image_path) as img:
+            send_original = max(img.size) <= MAX_EDGE
+    except Exception:
+        send_original = False # Let downscale_image report it
+    if send_original:
+        encoded = encode_file(image_path, digest)
+        return digest.hexdigest(), encoded
+    with open(image_path, "rb") as f:
+        while chunk := f.read(ENCODE_CHUNK_SIZE):
+            digest.update(chunk)
+    image_hash = digest.hexdigest()
+    return image_hash, encode_file(downscale_image(image_path, image_hash))
 
-def analyze_image(image_path):
+def response_cache_key(image_hash):
+    return hashlib.sha256(f"{image_hash}:{MODEL}:{PROMPT_HASH}".encode('utf-8')).hexdigest()
+
+def load_cached_response(cache_key):
+    cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
     try:
-        base64_image = encode_image(image_path)
-        
-        prompt = (
-            "Analyze this image and provide a structured analysis in JSON format.\n"
-            "Return a single Valid JSON object with the following keys:\n"
-            "- \"type\": one of [\"document\", \"photograph\", \"logo\", \"diagram\", \"other\", \"empty\"]\n"
-            "- \"objects_detected\": list of strings (names of key objects found, empty if none)\n"
-            "- \"needs_ocr\": boolean (true if significant text is visible that needs extraction)\n"
-            "- \"is_empty\": boolean (true if the image is blank, solid color, or noise)\n"
-            "- \"is_photo\": boolean (true if the image is a photograph of people/places, NOT a scanned document)\n"
-            "- \"is_blacked_out\": boolean (true if the image is significantly redacted or blacked out)\n"
-            "- \"inappropriate\": boolean (true if the image depicts inappropriate content, specifically older individuals interacting with children)\n"
-            "- \"rotation_correction\": integer (0, 90, 180, or 270 - degrees to rotate CLOCKWISE to correct orientation)\n"
-            "- \"description\": string (a detailed visual description of the content)\n"
-            "\nExample Output:\n"
-            "{\n"
-            "  \"type\": \"document\",\n"
-            "  \"objects_detected\": [],\n"
-            "  \"needs_ocr\": true,\n"
-            "  \"is_empty\": false,\n"
-            "  \"is_photo\": false,\n"
-            "  \"is_blacked_out\": false,\n"
-            "  \"inappropriate\": false,\n"
-            "  \"rotation_correction\": 0,\n"
-            "  \"description\": \"A scanned letter with handwritten signatures.\"\n"
-            "}"
-        )
+        with open(cache_path, 'rb') as f:
+            entry = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    # The key already covers these, but don't trust a hand-copied or truncated entry
+    if not isinstance(entry, dict) or entry.get("model") != MODEL or entry.get("prompt") != PROMPT_HASH:
+        return None
+    return entry.get("content")
+
+def save_cached_response(cache_key, content):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
+    try:
+        write_json_atomic(cache_path, {"model": MODEL, "prompt": PROMPT_HASH, "content": content})
+    except OSError as e:
+        print(f"Warning: Could not write response cache {cache_path}: {e}")
+
+async def analyze_image(session, endpoint, image_path):
+    """
+    Returns (response text or None, cache key to store it under once it parses).
+    The key is None for cache hits, which are already stored.
+    """
+    try:
+        # Resize, file read + base64 are blocking, keep them off the event loop
+        image_hash, base64_image = await asyncio.to_thread(encode_image, image_path)
+
+        # Byte-identical images (repeated logos, blank pages) only hit the model once
+        cache_key = response_cache_key(image_hash)
+        cached = load_cached_response(cache_key)
+        if cached:
+            print(f"Cache hit for {image_path}")
+            return cached, None
 
         payload = {
             "model": MODEL,
@@ -65,7 +204,7 @@ def analyze_image(image_path):
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
+                        {"type": "text", "text": PROMPT},
                         {
                             "type": "image_url",
                             "image_url": {
@@ -78,55 +217,38 @@ def analyze_image(image_path):
             "temperature": 0.7
         }
 
-        response = requests.post(LM_STUDIO_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with session.post(endpoint, json=payload, timeout=timeout) as response:
+            response.raise_for_status()
+            result = await response.json()
+        content = result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        return content, cache_key
 
     except Exception as e:
         print(f"Error analyzing {image_path}: {e}")
-        return None
-
-def process_directory(url, meta, overwrite=False):
-    extraction_dir = meta.get("extraction_dir")
-    if not extraction_dir or not os.path.exists(extraction_dir):
-        # Fallback: construct extraction dir from local_path if missing
-        local_path = meta.get("local_path")
-        if local_path:
-            stem = os.path.splitext(os.path.basename(local_path))[0]
-            extraction_dir = os.path.join(os.path.dirname(local_path), stem)
-    
-    if not extraction_dir or not os.path.exists(extraction_dir):
-        return
-
-    images_dir = os.path.join(extraction_dir, "images")
-    if not os.path.exists(images_dir):
-        return
+        return None, None
 
-    images = [f for f in os.listdir(images_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    if not images:
-        return
+def migrate_legacy_files(images, legacy):
+    """
+    Moves old-style images/foo.jpg.json / .txt results into images/foo/analysis.json / .txt.
+    Returns the names of the target directories it touched (they now exist).
+    """
+    touched = set()
+    for img_name, img_path in images:
+        has_json = img_name + ".json" in legacy
+        has_txt = img_name + ".txt" in legacy
+        if not (has_json or has_txt):
+            continue
 
-    print(f"Found {len(images)} images in {images_dir}")
-    
-    analyzed_count = 0
-    for img_name in images:
-        img_path = os.path.join(images_dir, img_name)
-        
-        # Determine target directory and file paths
-        # e.g. images/foo.jpg -> images/foo/analysis.json
         target_dir = os.path.splitext(img_path)[0]
         os.makedirs(target_dir, exist_ok=True)
-        
+        touched.add(os.path.basename(target_dir))
         json_path = os.path.join(target_dir, "analysis.json")
         txt_path = os.path.join(target_dir, "analysis.txt")
-        
-        # Migration Logic: Check for old files and move them if new ones don't exist
         old_json_path = img_path + ".json"
         old_txt_path = img_path + ".txt"
-        
-        if os.path.exists(old_json_path):
+
+        if has_json:
             if not os.path.exists(json_path):
                 try:
                     os.rename(old_json_path, json_path)
@@ -139,147 +261,216 @@ def process_directory(url, meta, overwrite=False):
                 # For now let's just log it.
                 print(f"Notice: Both {old_json_path} and {json_path} exist. Keeping new, ignoring old.")
 
-        if os.path.exists(old_txt_path):
+        if has_txt:
             if not os.path.exists(txt_path):
                  try:
                     os.rename(old_txt_path, txt_path)
                     print(f"Migrated {old_txt_path} -> {txt_path}")
                  except OSError as e:
                     print(f"Error migrating {old_txt_path}: {e}")
+    return touched
 
+def resolve_images_dirs(items):
+    """
+    Resolves each document's images/ directory up front. Existence checks are answered
+    from one cached scandir per parent directory instead of several stats per document.
+    Returns [(url, images_dir)] for documents that have one.
+    """
+    listings = {}
+
+    def dir_exists(path):
+        parent, name = os.path.split(os.path.normpath(path))
+        if parent not in listings:
+            try:
+                with os.scandir(parent or ".") as it:
+                    listings[parent] = {e.name for e in it if e.is_dir()}
+            except OSError:
+                listings[parent] = set()
+        return name in listings[parent]
+
+    resolved = []
+    for url, meta in items:
+        extraction_dir = meta.get("extraction_dir")
+        if not extraction_dir or not dir_exists(extraction_dir):
+            # Fallback: construct extraction dir from local_path if missing
+            local_path = meta.get("local_path")
+            if local_path:
+                stem = os.path.splitext(os.path.basename(local_path))[0]
+                extraction_dir = os.path.join(os.path.dirname(local_path), stem)
+
+        if not extraction_dir or not dir_exists(extraction_dir):
+            continue
+        # images/ itself is checked by the scandir in process_directory
+        resolved.append((url, os.path.join(extraction_dir, "images")))
+    return resolved
+
+async def process_directory(session, endpoint, semaphore, images_dir, overwrite=False):
+    """
+    Analyzes every image of one document. Returns the inventory fields to update, or None.
+    """
+    # One directory read gives us the images, their legacy sidecars and their target dirs
+    try:
+        with os.scandir(images_dir) as it:
+            entries = list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    sibling_names = {e.name for e in entries}
+    images = [(e.name, e.path) for e in entries if e.is_file() and e.name.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    if not images:
+        return
+
+    print(f"Found {len(images)} images in {images_dir}")
+    
+    # Legacy sidecars are rare once migrated, so find them all up front and skip the per-image checks
+    legacy = {name for name in sibling_names if name.endswith(('.json', '.txt'))}
+    if legacy:
+        sibling_names |= migrate_legacy_files(images, legacy)
+
+    async def handle_image(img_name, img_path):
+        # Determine target directory and file paths
+        # e.g. images/foo.jpg -> images/foo/analysis.json
+        target_dir = os.path.splitext(img_path)[0]
+
+        if img_path in _analyzed and not overwrite:
+            # Checkpointed: one stat instead of listing the directory
+            if os.path.exists(os.path.join(target_dir, "analysis.json")):
+                return False
+            # Removed since (e.g. by cleanup_analysis.sh), analyze it again
+            print(f"Checkpointed {img_name} has no analysis.json, re-analyzing")
+            _analyzed.discard(img_path)
+
+        json_path = os.path.join(target_dir, "analysis.json")
+        txt_path = os.path.join(target_dir, "analysis.txt")
+
+        # Only stat for analysis.json when the target directory is known to exist
+        if os.path.basename(target_dir) in sibling_names:
+            has_analysis = os.path.exists(json_path)
+        else:
+            os.makedirs(target_dir, exist_ok=True)
+            has_analysis = False
+    
         # Check if analysis already exists (in new location)
-        if os.path.exists(json_path) and not overwrite:
-            continue # Already analyzed
+        if has_analysis and not overwrite:
+            record_checkpoint(img_path)
+            return False # Already analyzed
 
         print(f"Analyzing {img_name} with {MODEL}...")
-        description = analyze_image(img_path)
-        
+        async with semaphore:
+            description, cache_key = await analyze_image(session, endpoint, img_path)
+    
         if description:
             # Try to find JSON block
-            import re
-            
             clean_json = None
-            
+        
             # Strategy 1: strict markdown code block
-            code_block = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', description, re.DOTALL)
+            code_block = _CODE_BLOCK_RE.search(description)
             if code_block:
                 clean_json = code_block.group(1)
-            
+        
             # Strategy 2: loose search for first { and last }
             if not clean_json:
-                json_match = re.search(r'\{.*\}', description, re.DOTALL)
+                json_match = _BRACE_SPAN_RE.search(description)
                 if json_match:
                     clean_json = json_match.group(0)
 
             if clean_json:
-                try:
-                    # Remove comments (// ...)
-                    clean_json = re.sub(r'//.*$', '', clean_json, flags=re.MULTILINE)
-                    
-                    # Fix unescaped newlines within strings.
-                    # This is tricky without a full parser, but we can try to escape control chars.
-                    # Specialized fix for "description" field having unescaped quotes or Python-style triple quotes
-                    # Pattern: "description":\s*("{1,3})((?:.|\n)*?)("{1,3}\s*\}(\s*)?)$
-                    def fix_description_quotes(full_json_str):
-                        # Matches "description": "..." or "description": """..."""
-                        # We capture the opening quote(s), the content, and the closing quote(s) + closing brace
-                        pattern = r'("description"\s*:\s*("{1,3}))((?:.|\n)*?)("{1,3}\s*\}(\s*)?)$'
-                        match = re.search(pattern, full_json_str, re.DOTALL)
-                        if match:
-                            prefix_full = match.group(1) # "description": """
-                            opener = match.group(2)      # """
-                            content = match.group(3)     # content inside
-                            suffix_full = match.group(4) # """ }
-                            closer = match.group(5)      # """ (part of suffix_full) but we need to match it roughly
-
-                            # We want to replace the opener/closer with a simple single quote "
-                            # And we want to escape the content.
-                            
-                            # Reconstruct prefix with just one quote
-                            new_prefix = '"description": "'
-                            
-                            # Clean content:
-                            # 1. Escape backslashes first?
-                            # content = content.replace('\\', '\\\\') # Dangerous if already escaped?
-                            # 2. Escape double quotes "
-                            fixed_content = content.replace('"', '\\"')
-                            # 3. Escape newlines
-                            fixed_content = fixed_content.replace('\n', '\\n').replace('\r', '')
-                            
-                            return full_json_str[:match.start()] + new_prefix + fixed_content + '"\n}'
-                        return full_json_str
-
-                    clean_json_fixed = fix_description_quotes(clean_json)
-                    
-                    # Original newline fix logic for other fields (if any), modified to be safer
-                    def escape_newlines(match):
-                         return match.group(0).replace('\n', '\\n').replace('\r', '')
-                    
-                    # Apply general newline fix to the whole thing (careful not to double escape description if validation passes)
-                    # Actually, if we fixed description, we might have fixed the main culprit.
-                    # Let's try parsing.
-                    
-                    try:
-                        json_obj = json.loads(clean_json_fixed)
-                    except:
-                        # If that failed, try the general newline fix on the *original* string (or the fixed one?)
-                        # The regex fix_description_quotes returns the full string with modification.
-                        # Run the general newline escaper on top of it?
-                         clean_json_fixed_2 = re.sub(r'"((?:[^"\\]|\\.)*)"', escape_newlines, clean_json_fixed, flags=re.DOTALL)
-                         json_obj = json.loads(clean_json_fixed_2)
-                    with open(json_path, "w") as f:
-                        json.dump(json_obj, f, indent=2)
+                # One linear repair pass handles comments, unescaped quotes/newlines,
+                # triple-quoted descriptions and trailing commas
+                json_obj = repair_json(clean_json, return_objects=True)
+                if json_obj and isinstance(json_obj, dict):
+                    # Only cache complete answers; cleanup_analysis.sh deletes ones without is_photo
+                    # and a cached copy would just bring them back
+                    if cache_key and "is_photo" in json_obj:
+                        save_cached_response(cache_key, description)
+                    write_json_atomic(json_path, json_obj)
                     print(f"Saved analysis to {json_path}")
-                    analyzed_count += 1
-                except (json.JSONDecodeError, Exception) as e:
-                    # Fallback attempt without sanitization or save as txt
-                    try:
-                         json_obj = json.loads(clean_json, strict=False)
-                         with open(json_path, "w") as f:
-                            json.dump(json_obj, f, indent=2)
-                         print(f"Saved analysis to {json_path} (strict=False)")
-                         analyzed_count += 1
-                    except Exception as e2:
-                        print(f"Final warning: Could not parse JSON for {img_name}: {e2}. Saving raw response to .txt")
-                        with open(txt_path, "w") as f:
-                            f.write(description)
+                    record_checkpoint(img_path)
+                    return True
+
+                print(f"Final warning: Could not parse JSON for {img_name}. Saving raw response to .txt")
+                with open(txt_path, "w") as f:
+                    f.write(description)
             else:
                  print(f"Warning: No JSON found in response for {img_name}. Saving raw response to .txt")
                  with open(txt_path, "w") as f:
                     f.write(description)
-        
-        # Optional sleep to be nice to local GPU if needed
-        # time.sleep(0.5)
+        return False
+
+    results = await asyncio.gather(*(handle_image(img_name, img_path) for img_name, img_path in images))
+    analyzed_count = sum(results)
 
     if analyzed_count > 0:
-        meta["image_analysis_status"] = "partial" if analyzed_count < len(images) else "done"
-        update_item(url, meta)
+        return {"image_analysis_status": "partial" if analyzed_count < len(images) else "done"}
+    return None
+
+async def process_urls(items, endpoint, overwrite=False):
+    """
+    items is [(url, images_dir)]. Runs inside a worker process: one event loop, session and semaphore per chunk of URLs.
+    Returns {url: inventory updates} for the parent to apply.
+    """
+    global _analyzed, _checkpoint
+    if _checkpoint is None:
+        _analyzed = load_checkpoint()
+        _checkpoint = open(CHECKPOINT_FILE, 'a', encoding='utf-8')
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY + 3)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        results = await asyncio.gather(*(process_directory(session, endpoint, semaphore, images_dir, overwrite=overwrite) for _, images_dir in items))
+    return {url: data for (url, _), data in zip(items, results) if data}
+
+def worker(task):
+    items, endpoint, overwrite = task
+    return asyncio.run(process_urls(items, endpoint, overwrite=overwrite))
+
+async def check_endpoint(endpoint):
+    # Simple check - getting models usually works on /v1/models
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(endpoint.replace("/chat/completions", "/models"), timeout=aiohttp.ClientTimeout(total=5)):
+                return True
+    except Exception:
+        return False
 
 def main():
     import argparse
+    # Helper for Windows multiprocessing
+    multiprocessing.freeze_support()
+
     parser = argparse.ArgumentParser(description="Analyze images using local LLM")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing descriptions")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
+    parser.add_argument("--endpoint", action="append", help="LM Studio chat completions URL (repeat to spread work across several servers)")
     args = parser.parse_args()
+    endpoints = args.endpoint or [LM_STUDIO_URL]
 
-    print(f"Starting Image Analysis using {MODEL} on {LM_STUDIO_URL}", flush=True)
+    print(f"Starting Image Analysis using {MODEL} on {', '.join(endpoints)}", flush=True)
     if args.overwrite:
         print("Overwrite mode enabled. Existing descriptions will be re-generated.", flush=True)
     
     # Verify LM Studio is up
-    try:
-        # Simple check - getting models usually works on /v1/models
-        requests.get(LM_STUDIO_URL.replace("/chat/completions", "/models"), timeout=5)
-    except Exception:
-        print("Error: Could not connect to LM Studio. Make sure it is running on port 1234.", flush=True)
-        return
+    for endpoint in endpoints:
+        if not asyncio.run(check_endpoint(endpoint)):
+            print(f"Error: Could not connect to LM Studio at {endpoint}. Make sure it is running.", flush=True)
+            return
 
     inventory = load_inventory()
     print(f"Loaded {len(inventory)} items.", flush=True)
-    
-    for url, meta in inventory.items():
-        # Process anything downloaded, even if extraction_status isn't fully marked 'done' handled by check
-        if meta.get("status") == "downloaded":
-             process_directory(url, meta, overwrite=args.overwrite)
+
+    # Process anything downloaded, even if extraction_status isn't fully marked 'done' handled by check
+    items = resolve_images_dirs((url, meta) for url, meta in inventory.items() if meta.get("status") == "downloaded")
+    chunks = [items[i:i + URLS_PER_CHUNK] for i in range(0, len(items), URLS_PER_CHUNK)]
+    tasks = [(chunk, endpoints[i % len(endpoints)], args.overwrite) for i, chunk in enumerate(chunks)]
+
+    # Parent owns the inventory; workers only report back what changed
+    try:
+        with multiprocessing.Pool(processes=args.workers) as pool:
+            for updates in pool.imap_unordered(worker, tasks):
+                for url, data in updates.items():
+                    update_item(inventory, url, data)
+    finally:
+        if _pending_updates:
+            flush_inventory(inventory)
 
     print("Image analysis pass complete.")
 
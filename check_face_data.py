@@ -14,7 +14,12 @@ def check_faces():
     print("Fetching faces...")
     # Get faces
     faces_ref = db.collection("faces").limit(20)
-    docs = faces_ref.stream()
+    docs = list(faces_ref.stream())
+
+    # Fetch all parent images in one batched RPC instead of one get() per face
+    parent_ids = {doc.to_dict().get("parent_image_id") for doc in docs} - {None, ""}
+    refs = [db.collection("images").document(pid) for pid in parent_ids]
+    parents = {snap.id: snap for snap in db.get_all(refs)} if refs else {}
     
     for doc in docs:
         data = doc.to_dict()
@@ -51,8 +56,8 @@ def check_faces():
         print(f"  doc_title: {doc_title}")
         
         if parent_id:
-            parent_doc = db.collection("images").document(parent_id).get()
-            if parent_doc.exists:
+            parent_doc = parents.get(parent_id)
+            if parent_doc is not None and parent_doc.exists:
                 p_data = parent_doc.to_dict()
                 thumb = p_data.get("preview_thumb")
                 med = p_data.get("preview_medium")
@@ -1,103 +1,152 @@
 import os
-import json
+import orjson
 import fitz  # pymupdf
+import concurrent.futures
+import multiprocessing
 
 INVENTORY_FILE = "epstein_files/inventory.json"
 PDF_DIR = "epstein_files"
+PDF_CHUNKSIZE = 8 # PDFs per worker dispatch
+# Append-only log of {"url", "update"} records, merged into the inventory once per run
+PATCH_FILE = "epstein_files/inventory_patches.jsonl"
+TEXT_THRESHOLD = 50 # Average chars per sampled page above which a PDF counts as text
 
 def load_inventory():
     try:
         if not os.path.exists(INVENTORY_FILE):
             return {}
-        with open(INVENTORY_FILE, 'r') as f:
-            return json.load(f)
+        with open(INVENTORY_FILE, 'rb') as f:
+            inv = orjson.loads(f.read())
     except Exception:
         return {}
+    # Replay anything a previous (interrupted) run logged but never merged
+    apply_patches(inv)
+    return inv
 
-def update_item(url, data):
-    # Atomic-ish update: load, update one item, save
-    # This is slow but safer if scraper is appending
+def apply_patches(inv):
+    if not os.path.exists(PATCH_FILE):
+        return 0
+    applied = 0
+    with open(PATCH_FILE, 'rb') as f:
+        for line in f:
+            try:
+                patch = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # Torn last line from a crash mid-write
+                continue
+            # Skip URLs no longer in the inventory (e.g. a stale log replayed after a rescrape)
+            meta = inv.get(patch["url"])
+            if meta is not None:
+                meta.update(patch["update"])
+                applied += 1
+    return applied
+
+def log_patch(f, url, update):
+    # One line per record, flushed immediately so a crash loses at most the record in flight
+    f.write(orjson.dumps({"url": url, "update": update}, option=orjson.OPT_APPEND_NEWLINE))
+    f.flush()
+
+def coalesce_patches():
+    """Merge the patch log into inventory.json with one atomic rewrite, then drop the log."""
+    if not os.path.exists(PATCH_FILE):
+        return
     inv = load_inventory()
-    if url in inv:
-        inv[url].update(data)
-        with open(INVENTORY_FILE, 'w') as f:
-            json.dump(inv, f, indent=2)
+    save_inventory(inv)
+    os.remove(PATCH_FILE)
 
+def save_inventory(inv):
+    # Compact dump to a temp file then rename, so a crash mid-write never truncates the inventory
+    tmp_path = INVENTORY_FILE + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(inv, option=orjson.OPT_APPEND_NEWLINE))
+    os.replace(tmp_path, INVENTORY_FILE)
+
+
+def classify_doc(doc):
+    """
+    Text-vs-scanned heuristic on an already open fitz document.
+    Shared with extract_content so a PDF only has to be opened once.
+    """
+    page_count = doc.page_count
+    total_text_len = 0
+    
+    # Check first few pages to save time? Or all?
+    # Let's check up to 5 pages for heuristic
+    pages_to_check = min(5, page_count)
+    # Once this much text is found the average can't drop below the threshold, stop reading pages
+    text_budget = TEXT_THRESHOLD * pages_to_check
+    
+    for i in range(pages_to_check):
+        # Plain text with no extra flags - we only count characters, layout doesn't matter
+        total_text_len += len(doc[i].get_text("text", flags=0).strip())
+        if total_text_len > text_budget:
+            break
+    
+    # Classification Logic
+    # If significant text found, it's TEXT (or searchable)
+    # If very little text, it's likely SCANNED/IMAGE
+    
+    # Threshold: average 50 chars per page?
+    avg_text = total_text_len / pages_to_check if pages_to_check > 0 else 0
+    
+    if avg_text > TEXT_THRESHOLD:
+        classification = "text"
+    else:
+        classification = "scanned"
+        
+    return {
+        "page_count": page_count,
+        "classification": classification,
+        "avg_text_per_page": avg_text
+    }
 
 def analyze_pdf(filepath):
     try:
         doc = fitz.open(filepath)
-        page_count = len(doc)
-        total_text_len = 0
-        total_image_area = 0
-        page_area = 0
-        
-        # Check first few pages to save time? Or all?
-        # Let's check up to 5 pages for heuristic
-        pages_to_check = min(5, page_count)
-        
-        for i in range(pages_to_check):
-            page = doc.load_page(i)
-            text = page.get_text()
-            total_text_len += len(text.strip())
-            
-            # Image area calculation
-            images = page.get_images()
-            for img in images:
-                # This gives us the XREF of the image, not the rect on page necessarily without more work
-                # Simpler: just count number of images?
-                # Or use page.get_text("dict") to find image blocks.
-                pass
-        
-        doc.close()
-        
-        # Classification Logic
-        # If significant text found, it's TEXT (or searchable)
-        # If very little text, it's likely SCANNED/IMAGE
-        
-        # Threshold: average 50 chars per page?
-        avg_text = total_text_len / pages_to_check if pages_to_check > 0 else 0
-        
-        if avg_text > 50:
-            classification = "text"
-        else:
-            classification = "scanned"
-            
-        return {
-            "page_count": page_count,
-            "classification": classification,
-            "avg_text_per_page": avg_text
-        }
-        
+        try:
+            return classify_doc(doc)
+        finally:
+            doc.close()
     except Exception as e:
         print(f"Error analyzing {filepath}: {e}")
         return {"error": str(e), "classification": "error"}
 
 def main():
+    # Helper for Windows multiprocessing
+    multiprocessing.freeze_support()
+
     inventory = load_inventory()
     print(f"Loaded {len(inventory)} items.")
     
-    updates = 0
-    for url, meta in inventory.items():
-        local_path = meta.get("local_path")
-        
-        # Skip if already classified or not downloaded
-        if meta.get("classification"):
-            continue
-            
-        if meta.get("status") != "downloaded" or not local_path or not os.path.exists(local_path):
-            continue
+    patch_log = open(PATCH_FILE, 'ab')
+    pdf_jobs = [] # (url, local_path)
+    try:
+        for url, meta in inventory.items():
+            local_path = meta.get("local_path")
             
-        if not local_path.lower().endswith(".pdf"):
-            update_item(url, {"classification": "other"})
-            updates += 1
-            continue
+            # Skip if already classified or not downloaded
+            if meta.get("classification"):
+                continue
+                
+            if meta.get("status") != "downloaded" or not local_path or not os.path.exists(local_path):
+                continue
+                
+            if not local_path.lower().endswith(".pdf"):
+                log_patch(patch_log, url, {"classification": "other"})
+                continue
 
-        print(f"Analyzing {local_path}...")
-        results = analyze_pdf(local_path)
-        
-        update_item(url, results)
-        updates += 1
+            pdf_jobs.append((url, local_path))
+
+        # analyze_pdf is pure (path in, dict out) and CPU-bound, so fan it out across cores.
+        # Each result is appended to the patch log as it arrives instead of rewriting the inventory.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            paths = [local_path for _, local_path in pdf_jobs]
+            for (url, local_path), results in zip(pdf_jobs, executor.map(analyze_pdf, paths, chunksize=PDF_CHUNKSIZE)):
+                print(f"Analyzed {local_path}: {results.get('classification')}")
+                log_patch(patch_log, url, results)
+    finally:
+        patch_log.close()
+        coalesce_patches()
         
     print("Classification complete.")
 
@@ -2,6 +2,7 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import os
+import sys
 
 # Initialize Firebase
 cred = credentials.Certificate("serviceAccountKey.json")
@@ -15,28 +16,39 @@ db = firestore.client()
 DOC_ID = "161-09"
 IMG_NAME = "page17_img1"
 IMG_ID = f"{DOC_ID}_{IMG_NAME}"
+IN_QUERY_LIMIT = 30 # Firestore caps 'in' filters at 30 values
 
-print(f"--- Inspecting Image: {IMG_ID} ---")
-
-# Get Image Data
-img_ref = db.collection("images").document(IMG_ID)
-img_doc = img_ref.get()
-
-if not img_doc.exists:
-    print(f"Image {IMG_ID} not found in Firestore.")
-else:
-    img_data = img_doc.to_dict()
-    print("Image Data:")
-    print(f"  Preview Medium: {img_data.get('preview_medium')}")
-    print(f"  Preview Thumb: {img_data.get('preview_thumb')}")
-    
-# Get Face Data
-faces_ref = db.collection("faces").where("parent_image_id", "==", IMG_ID)
-faces_docs = faces_ref.stream()
-
-print("\n--- Faces ---")
-for face in faces_docs:
-    data = face.to_dict()
-    print(f"Face ID: {face.id}")
-    print(f"  BBox: {data.get('bbox')}")
-    print(f"  Score: {data.get('det_score')}")
+# Image IDs can be passed on the command line, defaults to the one above
+IMG_IDS = sys.argv[1:] or [IMG_ID]
+
+# Get Image Data - one batched read for all images
+img_refs = [db.collection("images").document(img_id) for img_id in IMG_IDS]
+img_docs = {snap.id: snap for snap in db.get_all(img_refs)}
+
+# Get Face Data - one query per 30 images, grouped by parent client-side
+faces_by_image = {img_id: [] for img_id in IMG_IDS}
+for start in range(0, len(IMG_IDS), IN_QUERY_LIMIT):
+    chunk = IMG_IDS[start:start + IN_QUERY_LIMIT]
+    faces_ref = db.collection("faces").where("parent_image_id", "in", chunk)
+    for face in faces_ref.stream():
+        faces_by_image.setdefault(face.get("parent_image_id"), []).append(face)
+
+for img_id in IMG_IDS:
+    print(f"--- Inspecting Image: {img_id} ---")
+
+    img_doc = img_docs.get(img_id)
+    if img_doc is None or not img_doc.exists:
+        print(f"Image {img_id} not found in Firestore.")
+    else:
+        img_data = img_doc.to_dict()
+        print("Image Data:")
+        print(f"  Preview Medium: {img_data.get('preview_medium')}")
+        print(f"  Preview Thumb: {img_data.get('preview_thumb')}")
+
+    print("\n--- Faces ---")
+    for face in faces_by_image[img_id]:
+        data = face.to_dict()
+        print(f"Face ID: {face.id}")
+        print(f"  BBox: {data.get('bbox')}")
+        print(f"  Score: {data.get('det_score')}")
+    print()
@@ -1,56 +1,66 @@
 import os
 import json
+import orjson
 import logging
 import argparse
 import numpy as np
 import cv2
+from PIL import Image
 try:
     from insightface.app import FaceAnalysis
+    from insightface.app.common import Face
+    from insightface.model_zoo.scrfd import distance2bbox, distance2kps
 except ImportError:
     FaceAnalysis = None
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 INVENTORY_FILE = "epstein_files/inventory.json"
+# Most to least preferred; only the ones this onnxruntime build offers are used
+PREFERRED_PROVIDERS = ['CUDAExecutionProvider', 'CoreMLExecutionProvider', 'CPUExecutionProvider']
+
+# Files above this size are decoded at half resolution (cv2.IMREAD_REDUCED_COLOR_2)
+REDUCED_DECODE_MIN_BYTES = 1024 * 1024
+EXIF_ORIENTATION = 0x0112
+
+# Per-face bboxes/kps/scores (float32) and embeddings (float16), indexed like faces.json "faces"
+FACES_NPZ = "faces.npz"
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']
+
+_active_providers = None
+_model_name = 'buffalo_l'
+_cpu_app = None
+_batching = True
+_input_buffers = {} # (batch, h, w) -> reusable float32 NCHW detector input
 
 def load_inventory():
     try:
         if not os.path.exists(INVENTORY_FILE):
             logging.warning(f"Inventory file not found at {INVENTORY_FILE}")
             return {}
-        with open(INVENTORY_FILE, 'r') as f:
-            return json.load(f)
+        with open(INVENTORY_FILE, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         logging.error(f"Error loading inventory: {e}")
         return {}
 
-def serialize_face(face):
+def serialize_face(face, index):
     """
-    Convert an InsightFace object (bunch/dict) to a serializable dictionary.
+    Index entry for faces.json. The numeric data (bbox, kps, embedding)
+    lives in faces.npz at the same position, see face_arrays.
     """
-    # InsightFace returns objects that might need conversion for JSON serialization
     # Common keys: bbox, kps, det_score, landmark_2d_106, gender, age, embedding
     
-    data = {}
-    
-    # Bounding Box
-    if 'bbox' in face:
-        data['bbox'] = face['bbox'].astype(float).tolist()
-    
-    # Keypoints (Landmarks)
-    if 'kps' in face:
-        data['kps'] = face['kps'].astype(float).tolist()
+    data = {'id': index}
         
     # Detection Score
     if 'det_score' in face:
         data['det_score'] = float(face['det_score'])
-        
-    # Embedding (normed_embedding usually used for recognition)
-    if 'embedding' in face:
-        data['embedding'] = face['embedding'].astype(float).tolist()
-    elif 'normed_embedding' in face:
-        data['embedding'] = face['normed_embedding'].astype(float).tolist()
 
     # Age and Gender
     if 'age' in face:
@@ -60,10 +70,144 @@ def serialize_face(face):
         
     return data
 
-def process_image_directory(target_dir, app, overwrite=False):
+def face_arrays(faces, scale=1):
     """
-    Process a single image directory.
-    Expects analysis.json to exist in this directory.
+    Stack InsightFace results into the arrays saved in faces.npz.
+    scale maps coordinates from a reduced decode back to the original image.
+    """
+    arrays = {
+        'bboxes': np.array([face['bbox'] for face in faces], dtype='<f4').reshape(-1, 4) * scale,
+        'scores': np.array([face['det_score'] for face in faces], dtype='<f4'),
+    }
+    # Keypoints (Landmarks)
+    if all(face.get('kps') is not None for face in faces):
+        arrays['kps'] = np.array([face['kps'] for face in faces], dtype='<f4') * scale
+    # Embedding (normed_embedding usually used for recognition), half precision is plenty for cosine similarity
+    embeddings = [face['embedding'] if 'embedding' in face else face.get('normed_embedding') for face in faces]
+    if all(e is not None for e in embeddings):
+        arrays['embeddings'] = np.array(embeddings, dtype='<f2')
+    return arrays
+
+def build_face_app(providers, det_size, name=None):
+    global _active_providers, _model_name
+    _active_providers = providers
+    _model_name = name or _model_name
+    ctx_id = -1 if providers[0] == 'CPUExecutionProvider' else 0
+    app = FaceAnalysis(name=_model_name, root='.insightface', providers=providers)
+    app.prepare(ctx_id=ctx_id, det_size=(det_size, det_size))
+    return app
+
+def get_faces(app, img):
+    """
+    app.get(img), switching to a CPU-only model for the rest of the run if the
+    accelerated ONNX session fails.
+    """
+    global _cpu_app
+    if _cpu_app is not None:
+        return _cpu_app.get(img)
+    try:
+        return app.get(img)
+    except Exception as e:
+        if _active_providers == ['CPUExecutionProvider']:
+            raise
+        logging.warning(f"Accelerated inference failed ({e}), falling back to CPUExecutionProvider.")
+        _cpu_app = build_face_app(['CPUExecutionProvider'], app.det_size[0])
+        return _cpu_app.get(img)
+
+def detect_batch(app, imgs):
+    """
+    Run the SCRFD detector on several images in one session.run call, then the
+    remaining models (landmarks, genderage, recognition) per face as app.get does.
+    Images are letterboxed to app.det_model.input_size exactly like SCRFD.detect.
+    """
+    det = app.det_model
+    in_w, in_h = det.input_size
+    pad = -det.input_mean / det.input_std
+    # Allocated once per batch shape and refilled in place for every call
+    shape = (len(imgs), 3, in_h, in_w)
+    blob = _input_buffers.get(shape)
+    if blob is None:
+        blob = _input_buffers[shape] = np.empty(shape, dtype=np.float32)
+    scales = []
+    for b, img in enumerate(imgs):
+        h, w = img.shape[:2]
+        if float(h) / w > float(in_h) / in_w:
+            new_h, new_w = in_h, int(in_h * w / h)
+        else:
+            new_w, new_h = in_w, int(in_w * h / w)
+        scales.append(float(new_h) / h)
+        resized = cv2.resize(img, (new_w, new_h))
+        slot = blob[b]
+        slot.fill(pad)
+        # BGR HWC uint8 -> RGB CHW normalized, written straight into the batch buffer
+        np.subtract(resized[:, :, ::-1].transpose(2, 0, 1), det.input_mean, out=slot[:, :new_h, :new_w])
+        np.multiply(slot[:, :new_h, :new_w], 1.0 / det.input_std, out=slot[:, :new_h, :new_w])
+
+    net_outs = det.session.run(det.output_names, {det.input_name: blob})
+    # Batched exports give (B, N, C); others flatten the batch into (B*N, C)
+    net_outs = [out.reshape(len(imgs), -1, out.shape[-1]) for out in net_outs]
+
+    results = []
+    fmc = det.fmc
+    for b, img in enumerate(imgs):
+        scores_list, bboxes_list, kpss_list = [], [], []
+        for idx, stride in enumerate(det._feat_stride_fpn):
+            scores = net_outs[idx][b]
+            bbox_preds = net_outs[idx + fmc][b] * stride
+            height, width = in_h // stride, in_w // stride
+            key = (height, width, stride)
+            anchor_centers = det.center_cache.get(key)
+            if anchor_centers is None:
+                anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+                anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+                if det._num_anchors > 1:
+                    anchor_centers = np.stack([anchor_centers] * det._num_anchors, axis=1).reshape((-1, 2))
+                det.center_cache[key] = anchor_centers
+            pos_inds = np.where(scores >= det.det_thresh)[0]
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(distance2bbox(anchor_centers, bbox_preds)[pos_inds])
+            if det.use_kps:
+                kpss = distance2kps(anchor_centers, net_outs[idx + fmc * 2][b] * stride)
+                kpss_list.append(kpss.reshape((kpss.shape[0], -1, 2))[pos_inds])
+
+        scores = np.vstack(scores_list)
+        order = scores.ravel().argsort()[::-1]
+        pre_det = np.hstack((np.vstack(bboxes_list) / scales[b], scores)).astype(np.float32, copy=False)
+        pre_det = pre_det[order, :]
+        keep = det.nms(pre_det)
+        bboxes = pre_det[keep, :]
+        kpss = (np.vstack(kpss_list) / scales[b])[order][keep] if det.use_kps else None
+
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+            for taskname, model in app.models.items():
+                if taskname == 'detection':
+                    continue
+                model.get(img, face)
+            faces.append(face)
+        results.append(faces)
+    return results
+
+def warm_up(app, batch_size):
+    """
+    Run one blank batch through the detector so the ONNX session is initialized
+    and the input buffer allocated before the first real image.
+    Also finds out up front whether the model accepts batches.
+    """
+    global _batching
+    in_w, in_h = app.det_model.input_size
+    try:
+        detect_batch(app, [np.zeros((in_h, in_w, 3), dtype=np.uint8)] * batch_size)
+    except Exception as e:
+        logging.warning(f"Batched detection unavailable ({e}), processing one image at a time.")
+        _batching = False
+
+def find_source_image(target_dir, overwrite=False, basename_to_path=None):
+    """
+    Resolve the original image for a per-image analysis directory.
+    basename_to_path is the listing of the parent images dir from scan_images_dir,
+    if the caller has one. Returns (image_path, faces_path), or None if it should be skipped.
     """
     # analysis_path = os.path.join(target_dir, "analysis.json")
     faces_path = os.path.join(target_dir, "faces.json")
@@ -106,52 +250,140 @@ def process_image_directory(target_dir, app, overwrite=False):
     parent_dir = os.path.dirname(target_dir)
     base_name = os.path.basename(target_dir)
     
-    # Try common extensions
-    image_path = None
-    for ext in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-        possible_path = os.path.join(parent_dir, base_name + ext)
-        if os.path.exists(possible_path):
-            image_path = possible_path
-            break
+    if basename_to_path is not None:
+        image_path = basename_to_path.get(base_name)
+    else:
+        # Try common extensions
+        image_path = None
+        for ext in IMAGE_EXTENSIONS:
+            possible_path = os.path.join(parent_dir, base_name + ext)
+            if os.path.exists(possible_path):
+                image_path = possible_path
+                break
             
     if not image_path:
         logging.warning(f"Could not find original image for {target_dir}")
         return
 
-    logging.info(f"Detecting faces in {image_path}...")
-    
-    try:
+    return image_path, faces_path
+
+def scan_images_dir(images_dir):
+    """
+    One scandir of an images/ folder.
+    Returns (subdirectory paths, {basename: source image path}).
+    """
+    subdirs = []
+    basename_to_path = {}
+    with os.scandir(images_dir) as it:
+        for entry in it:
+            if entry.is_dir():
+                subdirs.append(entry.path)
+                continue
+            stem, ext = os.path.splitext(entry.name)
+            if ext in IMAGE_EXTENSIONS and entry.is_file():
+                # Keep the first extension in IMAGE_EXTENSIONS order, same as the exists() probe did
+                current = basename_to_path.get(stem)
+                if current is None or IMAGE_EXTENSIONS.index(ext) < IMAGE_EXTENSIONS.index(os.path.splitext(current)[1]):
+                    basename_to_path[stem] = entry.path
+    return subdirs, basename_to_path
+
+def read_image(image_path):
+    """
+    Decode an image for detection. Large files are decoded at half resolution,
+    which is much faster and still above det_size for scanned pages.
+    Returns (img, scale, (width, height)) where scale maps img coordinates back to the
+    original and (width, height) is the original's size (None if img is None).
+    """
+    if os.path.getsize(image_path) <= REDUCED_DECODE_MIN_BYTES:
         img = cv2.imread(image_path)
+        return img, 1, (img.shape[1], img.shape[0]) if img is not None else None
+
+    img = cv2.imread(image_path, cv2.IMREAD_REDUCED_COLOR_2)
+    if img is None:
+        return None, 2, None
+    # The half-size decode rounds odd dimensions, so doubling it back can be a pixel off;
+    # take the real size from the header (read without decoding the pixels)
+    try:
+        with Image.open(image_path) as im:
+            w, h = im.size
+            # cv2 applies the EXIF rotation, so match it
+            if im.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                w, h = h, w
+    except Exception:
+        h, w = img.shape[0] * 2, img.shape[1] * 2
+    return img, 2, (w, h)
+
+def write_faces(faces_path, size, faces, scale=1):
+    if not faces:
+        # Write empty list to avoid re-processing
+        with open(faces_path, 'w') as f:
+            json.dump([], f)
+        return
+
+    # Dimensions of the original image, what ingest normalizes the bboxes by
+    w, h = size
+
+    # Arrays first: faces.json doubles as the "done" marker, so it's written last
+    npz_path = os.path.join(os.path.dirname(faces_path), FACES_NPZ)
+    np.savez(npz_path, **face_arrays(faces, scale))
+    
+    output_data = {
+        "source_dimensions": {"width": w, "height": h},
+        "arrays": FACES_NPZ,
+        "faces": [serialize_face(face, i) for i, face in enumerate(faces)]
+    }
+    
+    with open(faces_path, 'w') as f:
+        json.dump(output_data, f, indent=2)
+
+def process_batch(targets, app, batch_size=1, overwrite=False):
+    """
+    Detect faces for a list of (image directory, basename_to_path) pairs, batch_size images per
+    detector call. Falls back to per-image app.get if batching is unavailable.
+    """
+    global _batching
+    loaded = []
+    for target_dir, basename_to_path in targets:
+        found = find_source_image(target_dir, overwrite=overwrite, basename_to_path=basename_to_path)
+        if not found:
+            continue
+        image_path, faces_path = found
+        logging.info(f"Detecting faces in {image_path}...")
+        img, scale, size = read_image(image_path)
         if img is None:
             logging.error(f"Failed to read image {image_path}")
-            return
-            
-        faces = app.get(img)
-        
-        if not faces:
-            logging.info(f"No faces detected by InsightFace in {image_path}")
-            # Write empty list to avoid re-processing
-            with open(faces_path, 'w') as f:
-                json.dump([], f)
-            return
-
-        logging.info(f"Found {len(faces)} faces.")
-        
-        serialized_faces = [serialize_face(face) for face in faces]
-        
-        # Get dimensions (height, width, channels)
-        h, w = img.shape[:2]
-        
-        output_data = {
-            "source_dimensions": {"width": w, "height": h},
-            "faces": serialized_faces
-        }
-        
-        with open(faces_path, 'w') as f:
-            json.dump(output_data, f, indent=2)
-            
-    except Exception as e:
-        logging.error(f"Error processing {image_path}: {e}")
+            continue
+        loaded.append((image_path, faces_path, img, scale, size))
+
+    for start in range(0, len(loaded), batch_size):
+        chunk = loaded[start:start + batch_size]
+        results = None
+        # Single images go through detect_batch too, so they reuse the preallocated input buffer
+        if _batching and _cpu_app is None:
+            try:
+                results = detect_batch(app, [img for _, _, img, _, _ in chunk])
+            except Exception as e:
+                # e.g. a detector exported with a fixed batch dimension of 1
+                logging.warning(f"Batched detection failed ({e}), continuing one image at a time.")
+                _batching = False
+
+        for i, (image_path, faces_path, img, scale, size) in enumerate(chunk):
+            try:
+                faces = results[i] if results is not None else get_faces(app, img)
+                if faces:
+                    logging.info(f"Found {len(faces)} faces in {image_path}.")
+                else:
+                    logging.info(f"No faces detected by InsightFace in {image_path}")
+                write_faces(faces_path, size, faces, scale)
+            except Exception as e:
+                logging.error(f"Error processing {image_path}: {e}")
+
+def process_image_directory(target_dir, app, overwrite=False):
+    """
+    Process a single image directory.
+    Expects analysis.json to exist in this directory.
+    """
+    process_batch([(target_dir, None)], app, batch_size=1, overwrite=overwrite)
 
 def main():
     import warnings
@@ -161,7 +393,9 @@ def main():
     
     parser = argparse.ArgumentParser(description="Detect faces in images marked as containing faces.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing faces.json files")
+    parser.add_argument("--model", default="buffalo_l", help="InsightFace model pack under .insightface/models (e.g. buffalo_l_q from quantize_face_models.py)")
     parser.add_argument("--det-size", type=int, default=1280, help="Detection size (square input, default 1280)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per detector call (default 8, 1 disables batching)")
     parser.add_argument("--doc", help="Process only a specific document ID (or comma-separated list).")
     args = parser.parse_args()
 
@@ -173,25 +407,18 @@ def main():
     # Initialize InsightFace
     # accessing standard models - usually downloads to ~/.insightface/models/
     # using 'buffalo_l' as a good default
+    available = ort.get_available_providers() if ort else []
+    providers = [p for p in PREFERRED_PROVIDERS if p in available] or ['CPUExecutionProvider']
+    logging.info(f"Using ONNX Runtime providers: {providers}")
     try:
-        app = FaceAnalysis(name='buffalo_l', root='.insightface') 
-        app.prepare(ctx_id=0, det_size=(args.det_size, args.det_size)) # ctx_id=0 for GPU, -1 for CPU. Fallback to -1 if no GPU?
-        # Actually, let's try to detect if we can use GPU or auto?
-        # InsightFace usually fails if we pass 0 and no GPU.
-        # Safest for this environment (likely CPU mostly unless user has specific setup) might be -1?
-        # Or let's try 0 and catch? 
-        # For now, let's assume CPU (-1) to be safe unless we know otherwise.
-        # Wait, user is on Mac. Mac M1/M2 might support execution providers for onnxruntime.
-        # 'CoreMLExecutionProvider'?
-        # Let's stick to CPU for safety in first run.
-    except Exception:
+        app = build_face_app(providers, args.det_size, name=args.model)
+    except Exception as e:
         # Retry with CPU
-        app = FaceAnalysis(name='buffalo_l', root='.insightface', providers=['CPUExecutionProvider'])
-        app.prepare(ctx_id=-1, det_size=(args.det_size, args.det_size))
-        
-    # Re-init strictly for CPU to be safe for this script's stability
-    app = FaceAnalysis(name='buffalo_l', root='.insightface', providers=['CPUExecutionProvider'])
-    app.prepare(ctx_id=-1, det_size=(args.det_size, args.det_size))
+        logging.warning(f"Could not initialize with {providers} ({e}), retrying with CPU.")
+        app = build_face_app(['CPUExecutionProvider'], args.det_size)
+
+    batch_size = max(1, args.batch_size)
+    warm_up(app, batch_size)
 
     inventory = load_inventory()
     
@@ -202,6 +429,7 @@ def main():
     # 3. iterate images/ subfolder
     # 4. iterate subfolders of images/ (which are the image_name directories)
     
+    pending = []
     count = 0
     for url, meta in inventory.items():
         doc_id = meta.get("id")
@@ -235,14 +463,19 @@ def main():
         # So we look for directories.
         
         try:
-            candidates = [d for d in os.listdir(images_dir) if os.path.isdir(os.path.join(images_dir, d))]
+            candidates, basename_to_path = scan_images_dir(images_dir)
         except OSError:
             continue
             
-        for d in candidates:
-            target_dir = os.path.join(images_dir, d)
-            process_image_directory(target_dir, app, overwrite=args.overwrite)
-            count += 1
+        pending.extend((target_dir, basename_to_path) for target_dir in candidates)
+        while len(pending) >= batch_size:
+            process_batch(pending[:batch_size], app, batch_size=batch_size, overwrite=args.overwrite)
+            count += batch_size
+            del pending[:batch_size]
+
+    if pending:
+        process_batch(pending, app, batch_size=batch_size, overwrite=args.overwrite)
+        count += len(pending)
             
     logging.info("Face detection pass complete.")
 
@@ -1,26 +1,63 @@
 import os
 import json
 import glob
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+def iter_files(root):
+    # Recursive scandir: DirEntry type checks reuse the directory read instead of stat-ing each entry
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path)
+            elif entry.is_file():
+                yield entry
+
+def load_faces(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    elif isinstance(data, dict):
+        return data.get("faces", [])
+    return []
+
+def iter_faces(path):
+    """
+    Yield the face entries of a faces.json one at a time.
+    Streams with ijson when available so a huge file is never fully loaded;
+    falls back to json.load if ijson is missing or can't parse it.
+    """
+    if ijson is None:
+        yield from load_faces(path)
+        return
+
+    count = 0
+    try:
+        with open(path, 'rb') as f:
+            # Legacy files are a bare list, newer ones are {"faces": [...]}
+            head = f.read(64).lstrip()
+            f.seek(0)
+            prefix = 'item' if head.startswith(b'[') else 'faces.item'
+            for face in ijson.items(f, prefix):
+                count += 1
+                yield face
+    except ijson.JSONError:
+        # Re-parse with json for its error message (and to check anything after the bad spot)
+        yield from load_faces(path)[count:]
 
 def diagnose():
     root = "epstein_files"
     print(f"Scanning {root} for corrupt faces.json files...")
     
     # Walk the directory tree
-    for dirpath, dirnames, filenames in os.walk(root):
-        if "faces.json" in filenames:
-            path = os.path.join(dirpath, "faces.json")
+    for entry in iter_files(root):
+        if entry.name == "faces.json":
+            path = entry.path
             try:
-                with open(path, 'r') as f:
-                    data = json.load(f)
-                    
-                faces = []
-                if isinstance(data, list):
-                    faces = data
-                elif isinstance(data, dict):
-                    faces = data.get("faces", [])
-                
-                for i, face in enumerate(faces):
+                for i, face in enumerate(iter_faces(path)):
                     if not isinstance(face, dict):
                         print(f"FOUND CORRUPT FILE: {path}")
                         print(f"  Item {i} is type {type(face)}: {face}")
@@ -1,36 +1,59 @@
 import os
-import json
+import orjson
 import fitz  # pymupdf
+from classify_files import classify_doc, apply_patches
 import pathlib
+import zipfile
+import itertools
+import concurrent.futures
+import multiprocessing
 
 INVENTORY_FILE = "epstein_files/inventory.json"
 OUTPUT_DIR = "epstein_files"
+SAVE_EVERY = 100 # Inventory checkpoint interval
+PIXMAP_EXTS = ("jb2", "jpx") # Formats re-encoded through a Pixmap; JPEG/PNG etc. are written as-is
+IO_WORKERS = 4 # Image write threads per PDF
+UNZIP_WORKERS = 4 # zipfile releases the GIL while inflating, threads are enough
 
 def load_inventory():
     try:
         if not os.path.exists(INVENTORY_FILE):
             return {}
-        with open(INVENTORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(INVENTORY_FILE, 'rb') as f:
+            inv = orjson.loads(f.read())
     except Exception:
         return {}
+    # Fold in classify_files' patch log so rewriting inventory.json doesn't drop those updates;
+    # the log itself is left for classify_files to coalesce
+    apply_patches(inv)
+    return inv
 
-def update_item(url, data):
-    inv = load_inventory()
-    if url in inv:
-        inv[url].update(data)
-        with open(INVENTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(inv, f, indent=2)
+def save_inventory(inv):
+    # Compact dump to a temp file then rename, so a crash mid-write never truncates the inventory
+    tmp_path = INVENTORY_FILE + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(inv, option=orjson.OPT_APPEND_NEWLINE))
+    os.replace(tmp_path, INVENTORY_FILE)
 
 
+def pixmap_png(doc, xref):
+    pix = fitz.Pixmap(doc, xref)
+    if pix.n - pix.alpha >= 4:
+        # CMYK can't be written as PNG
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return pix.tobytes("png")
+
 def extract_content(url, meta):
+    """
+    Extract text and images from a downloaded PDF.
+    Returns the inventory fields to update, or None if nothing was extracted.
+    Does not modify meta, so it can run in a worker process.
+    """
     local_path = meta.get("local_path")
     if not local_path or not os.path.exists(local_path):
         return
         
     classification = meta.get("classification")
-    if not classification:
-        return
 
     # Create subdirectory
     # e.g. epstein_files/001.pdf -> epstein_files/001/
@@ -48,57 +71,110 @@ def extract_content(url, meta):
     images_dir = os.path.join(target_dir, "images")
     
     doc = fitz.open(local_path)
+    try:
+        update = {}
+        if not classification:
+            # Not classified yet: do it here on the already open document instead of a separate classify_files pass
+            update.update(classify_doc(doc))
+            classification = update["classification"]
+
+        if doc.page_count == 0:
+            return update or None
     
-    # TEXT EXTRACTION
-    # Ideally for 'text' or 'mixed'
-    if classification in ["text", "mixed", "scanned"]: # Try for all, even scanned might have simple layer
-        full_text = ""
-        for page in doc:
-            full_text += page.get_text() + "\n"
-        
-        if full_text.strip():
+        # TEXT EXTRACTION
+        # Ideally for 'text' or 'mixed'
+        if classification in ["text", "mixed", "scanned"]: # Try for all, even scanned might have simple layer
+            # Stream page by page instead of building the whole document text in memory
+            has_text = False
             with open(text_path, "w", encoding="utf-8") as f:
-                f.write(full_text)
+                for page in doc:
+                    text = page.get_text()
+                    f.write(text)
+                    f.write("\n")
+                    has_text = has_text or bool(text.strip())
+        
+            if not has_text:
+                # Same as before: no content.txt for pages without a text layer
+                os.remove(text_path)
                 
-    # IMAGE EXTRACTION
-    # For now, let's extract images if 'mixed' or 'scanned' or explicitly requested
-    # We'll do it for all to start, but limit count/size?
-    if not os.path.exists(images_dir):
-        os.makedirs(images_dir)
+        # IMAGE EXTRACTION
+        # For now, let's extract images if 'mixed' or 'scanned' or explicitly requested
+        # We'll do it for all to start, but limit count/size?
+        if not os.path.exists(images_dir):
+            os.makedirs(images_dir)
         
-    for i, page in enumerate(doc):
-        image_list = page.get_images()
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            
-            image_filename = f"page{i+1}_img{img_index+1}.{image_ext}"
-            image_filepath = os.path.join(images_dir, image_filename)
-            
-            with open(image_filepath, "wb") as f:
-                f.write(image_bytes)
-
-    meta["extraction_status"] = "done"
-    meta["extraction_dir"] = target_dir
-    print(f"Extracted {local_path} to {target_dir}")
+        # Letterheads/logos reuse the same xref on every page, only extract each one once
+        seen_xrefs = set()
+        # Writes go to a small thread pool so decoding the next image overlaps the previous flush
+        with concurrent.futures.ThreadPoolExecutor(max_workers=IO_WORKERS) as io_pool:
+            writes = []
+            for i, page in enumerate(doc):
+                image_list = page.get_images(full=True)
+                for img_index, img in enumerate(image_list):
+                    xref = img[0]
+                    if xref in seen_xrefs:
+                        continue
+                    seen_xrefs.add(xref)
+                    base_image = doc.extract_image(xref)
+                    image_bytes = base_image["image"]
+                    image_ext = base_image["ext"]
+                    if image_ext in PIXMAP_EXTS:
+                        # JBIG2/JPEG2000 streams: nothing downstream reads them, decode to PNG once here
+                        image_bytes = pixmap_png(doc, xref)
+                        image_ext = "png"
+                
+                    image_filename = f"page{i+1}_img{img_index+1}.{image_ext}"
+                    image_filepath = os.path.join(images_dir, image_filename)
+                
+                    writes.append(io_pool.submit(pathlib.Path(image_filepath).write_bytes, image_bytes))
+
+            # Surface any write error instead of silently reporting success
+            for future in writes:
+                future.result()
+
+        print(f"Extracted {local_path} to {target_dir}")
+        update.update({"extraction_status": "done", "extraction_dir": target_dir})
+        return update
+    finally:
+        doc.close()
+
+def extract_job(job):
+    url, meta = job
+    try:
+        return extract_content(url, meta)
+    except Exception as e:
+        print(f"Failed to extract {meta.get('local_path')}: {e}")
+        return None
+
+def unzip_file(local_path):
+    target_dir = os.path.splitext(local_path)[0]
+    try:
+        with zipfile.ZipFile(local_path, 'r') as zip_ref:
+            # Safety: check for malicious paths? For this purpose, basic extractall is likely fine.
+            zip_ref.extractall(target_dir)
+        print(f"Unzipped {local_path} to {target_dir}")
+        return {"extraction_status": "done", "extraction_dir": target_dir}
+    except Exception as e:
+        print(f"Failed to unzip {local_path}: {e}")
+        return None
 
 def main():
+    # Helper for Windows multiprocessing
+    multiprocessing.freeze_support()
+
     inventory = load_inventory()
     print(f"Loaded {len(inventory)} items.")
     
-    import zipfile
-    
-    updates = 0
+    pdf_jobs = [] # (url, meta)
+    zip_jobs = [] # (url, local_path)
     for url, meta in inventory.items():
         local_path = meta.get("local_path", "")
         if not local_path: 
             continue
-            
+        
         is_pdf = local_path.lower().endswith(".pdf")
         is_zip = local_path.lower().endswith(".zip")
-        
+    
         if not (is_pdf or is_zip):
             continue
 
@@ -115,27 +191,35 @@ def main():
                  text_path = os.path.join(extraction_dir, "content.txt")
                  if not os.path.exists(text_path):
                      should_process = True
-        
+    
         if should_process and meta.get("status") == "downloaded":
              if is_pdf:
-                extract_content(url, meta)
-             elif is_zip:
-                # Extract ZIP
-                target_dir = os.path.splitext(local_path)[0]
-                try:
-                    with zipfile.ZipFile(local_path, 'r') as zip_ref:
-                        # Safety: check for malicious paths? For this purpose, basic extractall is likely fine.
-                        zip_ref.extractall(target_dir)
-                    print(f"Unzipped {local_path} to {target_dir}")
-                    
-                    meta["extraction_status"] = "done"
-                    meta["extraction_dir"] = target_dir
-                    update_item(url, meta)
-                except Exception as e:
-                    print(f"Failed to unzip {local_path}: {e}")
-                    
-             updates += 1
-             
+                 pdf_jobs.append((url, meta))
+             else:
+                 zip_jobs.append((url, local_path))
+
+    # Each PDF is independent and opened in its own worker; results come back here
+    # so the inventory is only ever written by this process.
+    updates = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as pdf_pool, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=UNZIP_WORKERS) as zip_pool:
+            zip_results = zip_pool.map(unzip_file, [local_path for _, local_path in zip_jobs])
+            pdf_results = pdf_pool.map(extract_job, pdf_jobs)
+            finished = zip(
+                [url for url, _ in pdf_jobs] + [url for url, _ in zip_jobs],
+                itertools.chain(pdf_results, zip_results),
+            )
+            for url, result in finished:
+                if result:
+                    inventory[url].update(result)
+                updates += 1
+                if updates % SAVE_EVERY == 0:
+                    save_inventory(inventory)
+    finally:
+        if updates:
+            save_inventory(inventory)
+
     print("Extraction complete.")
 
 
@@ -1,32 +1,55 @@
 import os
-import json
+import orjson
+import hashlib
 import warnings
+import argparse
+import multiprocessing
 from PIL import Image, ExifTags
 import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+try:
+    import exifread
+except ImportError:
+    exifread = None
 
 # Suppress DecompressionBombWarning if images are very large
 warnings.simplefilter('ignore', Image.DecompressionBombWarning)
 
 TARGET_DIR = "epstein_files"
 OUTPUT_FILE = "metadata_inventory.json"
+SHARD_DIR = os.path.join(TARGET_DIR, "metadata") # --shards output: meta_shard_00..ff.jsonl
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tiff", ".tif", ".webp"}
+# Lowercase extension -> task kind; one lookup per file decides whether and how to handle it
+FILE_KINDS = dict.fromkeys(IMAGE_EXTENSIONS, "image")
+FILE_KINDS[".pdf"] = "pdf"
+SNIFF_BYTES = 65536
+FONT_SAMPLE_PAGES = 5  # Pages sampled for font names
+MAX_FONTS = 50         # Stop sampling fonts once this many are found
+ANNOT_SAMPLE_PAGES = 50 # Pages scanned for annotations
+MAX_ANNOT_TYPES = 8    # Stop once this many distinct annotation types are seen
+
+# Byte patterns that indicate EXIF or XMP somewhere in the file header
+METADATA_MARKERS = (
+    b'\xff\xe1',                       # JPEG APP1 (EXIF / XMP segment)
+    b'Exif\x00\x00',
+    b'http://ns.adobe.com/xap/1.0/',    # XMP packet namespace
+    b'XML:com.adobe.xmp',               # PNG iTXt keyword
+    b'eXIf', b'iTXt', b'tEXt', b'zTXt', # PNG metadata chunks
+    b'EXIF', b'XMP ',                   # WEBP RIFF chunks
+)
 
 def extract_exif(img):
     exif_data = {}
     try:
         exif = img.getexif()
         if exif:
+            tags_get = ExifTags.TAGS.get
             for k, v in exif.items():
-                if k in ExifTags.TAGS:
-                    key = ExifTags.TAGS[k]
-                else:
-                    key = k
+                key = tags_get(k, k)
                 # Handle binary data or non-serializable objects
-                if isinstance(v, bytes):
-                    try:
-                        v = v.decode('utf-8', errors='replace')
-                    except:
-                        v = str(v)
+                if type(v) is bytes:
+                    v = v.decode('utf-8', errors='replace')
                 exif_data[str(key)] = str(v)
     except Exception as e:
         exif_data["error"] = str(e)
@@ -54,6 +77,37 @@ def extract_xmp(img):
         xmp_data = f"Error extracting XMP: {str(e)}"
     return xmp_data
 
+def extract_exif_tags(fh):
+    # details=False skips MakerNotes, and the thumbnail is never read; no pixel decoder involved
+    # Output matches extract_exif (Pillow's getexif): IFD0 only, Pillow tag names, str values
+    exif_data = {}
+    try:
+        tags = exifread.process_file(fh, details=False, extract_thumbnail=False, builtin_types=True)
+        for key, v in tags.items():
+            ifd, _, name = key.partition(' ')
+            if ifd != 'Image':
+                continue # EXIF/GPS/Interop sub-IFDs and the thumbnail IFD, which getexif() doesn't list
+            if name.startswith('Tag 0x'):
+                name = str(int(name[4:], 16)) # Unknown tag, Pillow keys these by number
+            if type(v) is bytes:
+                v = v.decode('utf-8', errors='replace')
+            elif type(v) is list:
+                v = tuple(v) # Pillow hands multi-value tags back as tuples
+            exif_data[name] = str(v)
+    except Exception as e:
+        exif_data["error"] = str(e)
+    return exif_data
+
+def extract_xmp_head(head):
+    # XMP packets are plain XML, so pull them straight out of the header bytes
+    start = head.find(b'<x:xmpmeta')
+    if start == -1:
+        return ""
+    end = head.find(b'</x:xmpmeta>', start)
+    if end == -1:
+        return ""
+    return head[start:end + len(b'</x:xmpmeta>')].decode('utf-8', errors='replace')
+
 def extract_pdf_metadata(pdf_path):
     meta = {}
     try:
@@ -92,12 +146,14 @@ def extract_pdf_metadata(pdf_path):
         # 5. Fonts (Sample from first few pages to avoid massive overhead)
         fonts = set()
         try:
-            for i in range(min(3, doc.page_count)):
+            for i in range(min(FONT_SAMPLE_PAGES, doc.page_count)):
                 page = doc[i]
                 for font in page.get_fonts():
                     # (xref, ext, type, basefont, name, encoding)
                     if len(font) > 3:
                         fonts.add(font[3])
+                if len(fonts) >= MAX_FONTS:
+                    break
             if fonts:
                 meta['fonts'] = list(fonts)
         except:
@@ -106,18 +162,24 @@ def extract_pdf_metadata(pdf_path):
         # 6. Annotations (Summary)
         annot_count = 0
         annot_types = set()
+        annot_pages = 0
+        # Sampled too: walking every page of a 1000-page PDF just to count annots dominated the runtime
         try:
-            for page in doc:
-                for annot in page.annots():
+            for i in range(min(ANNOT_SAMPLE_PAGES, doc.page_count)):
+                annot_pages = i + 1
+                for annot in doc[i].annots():
                     annot_count += 1
                     annot_types.add(annot.type[1]) # type is typically (int, description)
+                if len(annot_types) >= MAX_ANNOT_TYPES:
+                    break
         except:
             pass
             
         if annot_count > 0:
             meta['annotations'] = {
-                "count": annot_count,
-                "types": list(annot_types)
+                "count": annot_count, # Within the first pages_scanned pages
+                "types": list(annot_types),
+                "pages_scanned": annot_pages
             }
             
         meta['page_count'] = doc.page_count
@@ -129,82 +191,245 @@ def extract_pdf_metadata(pdf_path):
         
     return meta
 
+def has_metadata_markers(head):
+    # TIFF headers are an IFD themselves, Pillow always reports tags for them
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return True
+    # Extended WebP puts the EXIF/XMP chunks after the image data, past the sniffed bytes;
+    # the VP8X header flags them up front (0x08 EXIF, 0x04 XMP)
+    if head[:4] == b'RIFF' and head[8:16] == b'WEBPVP8X' and len(head) > 20 and head[20] & 0x0C:
+        return True
+    return any(marker in head for marker in METADATA_MARKERS)
+
+def process_image(file_path):
+    """
+    Builds meta.json for an image (stored in its stem directory) if it has EXIF or XMP.
+    Returns (meta_path, metadata, merge), or None if there is nothing to write.
+    """
+    try:
+        # Most extracted images carry no metadata; a raw header read is far cheaper than Image.open
+        with open(file_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+            if not has_metadata_markers(head):
+                return None
+
+            if exifread is not None:
+                # Quick path: exifread parses only the EXIF IFDs, XMP comes from the header scan
+                f.seek(0)
+                exif = extract_exif_tags(f)
+                xmp = extract_xmp_head(head)
+                if not xmp and len(head) == SNIFF_BYTES:
+                    # The file goes on past the head (e.g. a big EXIF thumbnail pushes the XMP
+                    # APP1 further in, or a WebP keeps it after the image data), let Pillow look;
+                    # open() only parses the headers, no pixels are decoded
+                    f.seek(0)
+                    with Image.open(f) as img:
+                        xmp = extract_xmp(img)
+            else:
+                with Image.open(f) as img:
+                    exif = extract_exif(img)
+                    xmp = extract_xmp(img)
+
+        if exif or xmp:
+            target_dir = os.path.splitext(file_path)[0]
+            meta_file_path = os.path.join(target_dir, "meta.json")
+            metadata = {"exif": exif, "xmp": xmp}
+            return meta_file_path, metadata, False
+    except Exception:
+        pass
+    return None
+
+def process_pdf(file_path, target_dir):
+    """
+    Builds meta.json for a PDF's document directory; main merges it over any existing one.
+    Returns (meta_path, metadata, merge), or None if there is nothing to write.
+    """
+    metadata = extract_pdf_metadata(file_path)
+    if not metadata:
+        return None
+    return os.path.join(target_dir, "meta.json"), metadata, True
+
+def write_meta(meta_file_path, metadata, merge, meta_cache):
+    """
+    Write meta.json. With merge, existing content is kept and updated
+    (e.g. if we had other tools write to it). meta_cache holds what was
+    last written per path so files shared within a directory are parsed once.
+    """
+    if merge:
+        existing = meta_cache.get(meta_file_path)
+        if existing is None and os.path.exists(meta_file_path):
+            try:
+                existing = orjson.loads(Path(meta_file_path).read_bytes())
+            except:
+                existing = None # Overwrite if corrupt
+        if existing:
+            existing.update(metadata)
+            metadata = existing
+    meta_cache[meta_file_path] = metadata
+    os.makedirs(os.path.dirname(meta_file_path), exist_ok=True)
+    Path(meta_file_path).write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2, default=str))
+
+def shard_key(meta_file_path, base_dir):
+    # The directory the meta.json would live in, relative to TARGET_DIR, with / separators
+    return os.path.relpath(os.path.dirname(meta_file_path), base_dir).replace(os.sep, '/')
+
+def write_shard(handles, key, metadata, records):
+    """
+    Append metadata as one line to its hash shard instead of writing a meta.json.
+    handles maps shard name -> open file, so there are at most 256 open files.
+    records (from load_shards) holds the current record per path; like write_meta's merge,
+    the new fields are merged into it (an image 021.jpg and a PDF 021.pdf share a path),
+    so the last line for a path is always the complete record.
+    """
+    existing = records.get(key)
+    if existing:
+        metadata = {**existing, **metadata}
+    records[key] = metadata
+    name = hashlib.blake2b(key.encode(), digest_size=1).hexdigest()
+    f = handles.get(name)
+    if f is None:
+        f = handles[name] = open(os.path.join(SHARD_DIR, f"meta_shard_{name}.jsonl"), 'ab')
+    f.write(orjson.dumps({"path": key, **metadata}, default=str) + b"\n")
+
+def load_shards():
+    # Path -> record already in the shards (later lines win), so reruns skip those paths
+    # like existing meta.json files and new fields can be merged into them
+    records = {}
+    if not os.path.isdir(SHARD_DIR):
+        return records
+    with os.scandir(SHARD_DIR) as it:
+        for entry in it:
+            if not (entry.name.startswith("meta_shard_") and entry.name.endswith(".jsonl")):
+                continue
+            with open(entry.path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line)
+                        records.setdefault(record.pop("path"), {}).update(record)
+                    except Exception:
+                        pass # Truncated last line from an interrupted run
+    return records
+
+def dispatch(task):
+    kind, file_path, target_dir = task
+    if kind == "pdf":
+        return process_pdf(file_path, target_dir)
+    return process_image(file_path)
+
+def walk(root):
+    """
+    Like os.walk, but yields (root, dir_names, file_entries) with the directory names as a set,
+    so sibling-directory checks are a lookup instead of a stat. DirEntry type checks reuse the
+    directory read. All files of one directory come out together.
+    """
+    dirs, files = [], []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry)
+            elif entry.is_file():
+                files.append(entry)
+    yield root, {d.name for d in dirs}, files
+    for d in dirs:
+        yield from walk(d.path)
+
 def main():
+    # Helper for Windows multiprocessing
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="Extract EXIF/XMP and PDF metadata into meta.json files.")
+    parser.add_argument("--overwrite", action="store_true", help="Re-extract images that already have a meta.json")
+    parser.add_argument("--shards", action="store_true", help=f"Append to 256 JSONL shards in {SHARD_DIR} instead of writing a meta.json per file")
+    args = parser.parse_args()
+
     abs_target_dir = os.path.abspath(TARGET_DIR)
+    shard_records = None
+    if args.shards:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        shard_records = load_shards()
+        print(f"Found {len(shard_records)} entries already in {SHARD_DIR}.")
     
     print(f"Scanning {abs_target_dir} for images and PDFs...")
     
-    count = 0
-    saved_count = 0
+    tasks = [] # (kind, path, target_dir)
+    skipped = 0 # PDFs without a document directory, images already done
     
-    for root, dirs, files in os.walk(abs_target_dir):
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            file_path = os.path.join(root, file)
-            file_stem = os.path.splitext(file)[0]
-            
+    for root, dir_names, files in walk(abs_target_dir):
+        for entry in files:
+            file_stem, ext = os.path.splitext(entry.name)
+            kind = FILE_KINDS.get(ext.lower())
+            if kind is None:
+                continue
+            file_path = entry.path
+                
             # --- IMAGE PROCESSING ---
-            if ext in IMAGE_EXTENSIONS:
-                try:
-                    with Image.open(file_path) as img:
-                        exif = extract_exif(img)
-                        xmp = extract_xmp(img)
-                        
-                        if exif or xmp:
-                            target_dir = os.path.join(root, file_stem)
-                            os.makedirs(target_dir, exist_ok=True)
-                            
-                            meta_file_path = os.path.join(target_dir, "meta.json")
-                            metadata = {"exif": exif, "xmp": xmp}
-                            
-                            with open(meta_file_path, 'w', encoding='utf-8') as f:
-                                json.dump(metadata, f, indent=2)
-                            saved_count += 1
-                except Exception as e:
-                    # pass
-                    pass
-                count += 1
+            if kind == "image":
+                # Already extracted: only stat for meta.json when the stem directory exists
+                if not args.overwrite:
+                    meta_path = os.path.join(root, file_stem, "meta.json")
+                    if shard_records is not None:
+                        done = shard_key(meta_path, abs_target_dir) in shard_records
+                    else:
+                        done = file_stem in dir_names and os.path.exists(meta_path)
+                    if done:
+                        skipped += 1
+                        continue
+                tasks.append(("image", file_path, None))
 
             # --- PDF PROCESSING ---
-            elif ext == ".pdf":
+            else:
                 # Determine target directory for PDF metadata
                 # Rule: If pdf is '021.pdf', check Key Directory '021'
                 target_dir = None
-                
+                    
                 # Case 1: PDF is inside the document directory (e.g. 021/021.pdf) -> use root
                 if file_stem == os.path.basename(root):
                     target_dir = root
-                
+                    
                 # Case 2: PDF is sibling (e.g. 021.pdf next to 021/) -> use sibling dir
+                elif file_stem in dir_names:
+                    target_dir = os.path.join(root, file_stem)
+                    
+                if not target_dir:
+                    skipped += 1
+                elif (shard_records is not None and not args.overwrite
+                      and shard_key(os.path.join(target_dir, "meta.json"), abs_target_dir) in shard_records):
+                    skipped += 1 # Already in the shards; meta.json mode merges, so it always rewrites
                 else:
-                    sibling_dir = os.path.join(root, file_stem)
-                    if os.path.isdir(sibling_dir):
-                        target_dir = sibling_dir
-                
-                if target_dir:
-                    metadata = extract_pdf_metadata(file_path)
-                    if metadata:
-                        meta_file_path = os.path.join(target_dir, "meta.json")
-                        
-                        # Merge with existing if present (e.g. if we had other tools write to it)
-                        if os.path.exists(meta_file_path):
-                            try:
-                                with open(meta_file_path, 'r', encoding='utf-8') as f:
-                                    existing = json.load(f)
-                                    existing.update(metadata)
-                                    metadata = existing
-                            except:
-                                pass # Overwrite if corrupt
-                        
-                        with open(meta_file_path, 'w', encoding='utf-8') as f:
-                            json.dump(metadata, f, indent=2)
-                        saved_count += 1
-                count += 1
+                    tasks.append(("pdf", file_path, target_dir))
 
-            if count % 1000 == 0:
-                print(f"Processed {count} files... (Saved {saved_count} meta files)")
+    # PyMuPDF/Pillow parsing is CPU-bound, so it runs in worker processes;
+    # all writes stay here in the main process.
+    print(f"Extracting metadata from {len(tasks)} files...")
+    count = skipped
+    saved_count = 0
+    meta_cache = {}
+    current_root = None
+    shard_handles = {}
+    try:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for task, result in zip(tasks, executor.map(dispatch, tasks, chunksize=32)):
+                # Results come back in walk order; drop the cache once we move to another directory
+                root = os.path.dirname(task[1])
+                if root != current_root:
+                    meta_cache.clear()
+                    current_root = root
+                count += 1
+                if result:
+                    if args.shards:
+                        meta_file_path, metadata, _ = result
+                        write_shard(shard_handles, shard_key(meta_file_path, abs_target_dir), metadata, shard_records)
+                    else:
+                        write_meta(*result, meta_cache)
+                    saved_count += 1
+                if count % 1000 == 0:
+                    print(f"Processed {count} files... (Saved {saved_count} meta files)")
+    finally:
+        for f in shard_handles.values():
+            f.close()
 
-    print(f"Finished. Processed {count} files. Created/Updated {saved_count} meta.json files.")
+    where = f"entries in {SHARD_DIR}" if args.shards else "meta.json files"
+    print(f"Finished. Processed {count} files. Created/Updated {saved_count} {where}.")
 
 if __name__ == "__main__":
     main()
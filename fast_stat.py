@@ -0,0 +1,89 @@
+import os
+import sys
+import ctypes
+import platform
+
+# statx(2) lets us ask for just the mtime, and AT_STATX_DONT_SYNC tells NFS/SMB
+# to answer from cached attributes instead of a round trip to the server.
+# Linux only; everything else (or an old kernel) falls back to os.stat.
+
+AT_FDCWD = -100
+AT_STATX_DONT_SYNC = 0x4000
+STATX_MTIME = 0x40
+
+# statx isn't in glibc's ctypes-visible API everywhere, so go through syscall()
+SYS_STATX = {
+    "x86_64": 332,
+    "aarch64": 291,
+}
+
+class StatxTimestamp(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec", ctypes.c_int64),
+        ("tv_nsec", ctypes.c_uint32),
+        ("__reserved", ctypes.c_int32),
+    ]
+
+class Statx(ctypes.Structure):
+    # struct statx from <linux/stat.h>, 256 bytes
+    _fields_ = [
+        ("stx_mask", ctypes.c_uint32),
+        ("stx_blksize", ctypes.c_uint32),
+        ("stx_attributes", ctypes.c_uint64),
+        ("stx_nlink", ctypes.c_uint32),
+        ("stx_uid", ctypes.c_uint32),
+        ("stx_gid", ctypes.c_uint32),
+        ("stx_mode", ctypes.c_uint16),
+        ("__spare0", ctypes.c_uint16),
+        ("stx_ino", ctypes.c_uint64),
+        ("stx_size", ctypes.c_uint64),
+        ("stx_blocks", ctypes.c_uint64),
+        ("stx_attributes_mask", ctypes.c_uint64),
+        ("stx_atime", StatxTimestamp),
+        ("stx_btime", StatxTimestamp),
+        ("stx_ctime", StatxTimestamp),
+        ("stx_mtime", StatxTimestamp),
+        ("stx_rdev_major", ctypes.c_uint32),
+        ("stx_rdev_minor", ctypes.c_uint32),
+        ("stx_dev_major", ctypes.c_uint32),
+        ("stx_dev_minor", ctypes.c_uint32),
+        ("__spare2", ctypes.c_uint64 * 14),
+    ]
+
+def _load_statx():
+    if not sys.platform.startswith("linux"):
+        return None
+    nr = SYS_STATX.get(platform.machine())
+    if nr is None:
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        syscall = libc.syscall
+    except (OSError, AttributeError):
+        return None
+    syscall.restype = ctypes.c_long
+    return nr, syscall
+
+_statx = _load_statx()
+
+def mtime(path):
+    """
+    Modification time of path (a str or os.DirEntry) as a float, like os.path.getmtime.
+    Raises OSError if the file doesn't exist.
+    """
+    global _statx
+    if _statx is None:
+        if isinstance(path, os.DirEntry):
+            return path.stat().st_mtime
+        return os.path.getmtime(path)
+
+    nr, syscall = _statx
+    buf = Statx()
+    ret = syscall(nr, AT_FDCWD, os.fsencode(os.fspath(path)), AT_STATX_DONT_SYNC, STATX_MTIME, ctypes.byref(buf))
+    if ret != 0:
+        err = ctypes.get_errno()
+        if err == 38: # ENOSYS, kernel older than 4.11 (or blocked by seccomp)
+            _statx = None
+            return mtime(path)
+        raise OSError(err, os.strerror(err), os.fspath(path))
+    return buf.stx_mtime.tv_sec + buf.stx_mtime.tv_nsec / 1e9
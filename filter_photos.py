@@ -4,17 +4,89 @@ import os
 import json
 import argparse
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 logger = logging.getLogger(__name__)
 
 INVENTORY_FILE = "epstein_files/inventory.json"
+ANALYSIS_MAX_EDGE = 1024 # Longest edge images are reduced to before computing stats
+JPEG_EXTENSIONS = ('.jpg', '.jpeg') # The only inputs libjpeg can decode at reduced scale
+
+def read_for_analysis(img_path):
+    """
+    JPEGs are decoded at 1/4 or 1/2 scale when that still leaves at least ANALYSIS_MAX_EDGE pixels,
+    which lets libjpeg skip most of the IDCT work on large scans. The factor comes from the header,
+    so the file is only decoded once. Other formats have no scaled decode (OpenCV would decode at
+    full size and then resize), so they're read once at full size.
+    """
+    if img_path.lower().endswith(JPEG_EXTENSIONS):
+        try:
+            with Image.open(img_path) as im: # Header only, no pixel data
+                long_edge = max(im.size)
+        except Exception:
+            long_edge = 0
+        if long_edge >= ANALYSIS_MAX_EDGE * 4:
+            return cv2.imread(img_path, cv2.IMREAD_REDUCED_COLOR_4)
+        if long_edge >= ANALYSIS_MAX_EDGE * 2:
+            return cv2.imread(img_path, cv2.IMREAD_REDUCED_COLOR_2)
+    return cv2.imread(img_path)
+
+def gray_stats_numpy(gray):
+    counts = np.bincount(gray.ravel(), minlength=256)
+    # Std dev (single SIMD pass in OpenCV, same population std as np.std)
+    _, std = cv2.meanStdDev(gray)
+    lap = cv2.Laplacian(gray, cv2.CV_64F)
+    return counts, std[0, 0], lap.var()
+
+if njit is not None:
+    @njit(cache=True)
+    def _fused_gray_stats(gray):
+        # Histogram, sum/sum-of-squares and the 3x3 Laplacian in one pass over the buffer.
+        # Serial on purpose: a prange over the shared histogram would race.
+        h, w = gray.shape
+        hist = np.zeros(256, np.int64)
+        s = 0.0
+        s2 = 0.0
+        ls = 0.0
+        ls2 = 0.0
+        for y in range(h):
+            # Mirror at the edges like cv2's default BORDER_REFLECT_101
+            ym = y - 1 if y > 0 else min(1, h - 1)
+            yp = y + 1 if y < h - 1 else max(h - 2, 0)
+            for x in range(w):
+                xm = x - 1 if x > 0 else min(1, w - 1)
+                xp = x + 1 if x < w - 1 else max(w - 2, 0)
+                v = gray[y, x]
+                hist[v] += 1
+                fv = float(v)
+                s += fv
+                s2 += fv * fv
+                lap = float(gray[ym, x]) + float(gray[yp, x]) + float(gray[y, xm]) + float(gray[y, xp]) - 4.0 * fv
+                ls += lap
+                ls2 += lap * lap
+        return hist, s, s2, ls, ls2
+
+    def gray_stats(gray):
+        counts, s, s2, ls, ls2 = _fused_gray_stats(gray)
+        n = gray.size
+        mean = s / n
+        lap_mean = ls / n
+        return counts, np.sqrt(max(s2 / n - mean * mean, 0.0)), max(ls2 / n - lap_mean * lap_mean, 0.0)
+else:
+    gray_stats = gray_stats_numpy
 
 def is_likely_photo(img_path, thresholds=None):
     if thresholds is None:
@@ -27,35 +99,36 @@ def is_likely_photo(img_path, thresholds=None):
     
     try:
         logger.debug(f"Reading image: {img_path}")
-        img = cv2.imread(img_path)
+        img = read_for_analysis(img_path)
         if img is None:
             logger.warning(f"Failed to read image: {img_path}")
             return None, {}
         
+        # Every statistic below is computed on one downsample, full-res scans are 20-50 MP
+        scale = ANALYSIS_MAX_EDGE / max(img.shape[:2])
+        if scale < 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
-        # Entropy
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).flatten()
         # Avoid division by zero
-        total_pixels = hist.sum()
-        if total_pixels == 0:
+        if gray.size == 0:
              logger.warning(f"Image has 0 pixels: {img_path}")
              return None, {}
              
-        hist = hist / total_pixels
-        hist = hist[hist > 0]
-        entropy = -np.sum(hist * np.log2(hist))
+        # Histogram, std dev and Laplacian variance (one fused pass when numba is installed)
+        counts, std, lap_var = gray_stats(gray)
         
-        # Std dev
-        std = np.std(gray)
+        # Entropy
+        p = counts[counts > 0] / gray.size
+        entropy = -(p * np.log2(p)).sum()
         
         # Unique colors (fast approx)
         small = cv2.resize(img, (256, 256))
-        unique = len(np.unique(small.reshape(-1, 3), axis=0))
-        
-        # Laplacian variance
-        lap = cv2.Laplacian(gray, cv2.CV_64F)
-        lap_var = lap.var()
+        # Pack each BGR pixel into one uint32 so np.unique is a flat scalar sort, not a row-wise one
+        flat = small.reshape(-1, 3).astype(np.uint32)
+        packed = flat[:, 0] | (flat[:, 1] << 8) | (flat[:, 2] << 16)
+        unique = np.unique(packed).size
         
         score_photo = 0
         if entropy > thresholds['min_entropy']:      score_photo += 1
@@ -96,8 +169,15 @@ def process_directory(dir_path):
     # but the goal is to accompany analysis.json which is in the subdir.
     
     # Let's look for subdirectories first.
-    items = os.listdir(images_dir)
-    image_subdirs = [os.path.join(images_dir, item) for item in items if os.path.isdir(os.path.join(images_dir, item))]
+    # One scandir gives both the subdirs and the file names, so finding the source image is a set lookup
+    image_subdirs = []
+    file_names = set()
+    with os.scandir(images_dir) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                image_subdirs.append(entry.path)
+            elif entry.is_file():
+                file_names.add(entry.name)
     
     if not image_subdirs:
          # logger.debug(f"No image subdirectories found in {images_dir}")
@@ -116,9 +196,8 @@ def process_directory(dir_path):
         source_image_path = None
         
         for ext in extensions:
-            potential_path = os.path.join(images_dir, subdir_name + ext)
-            if os.path.exists(potential_path):
-                source_image_path = potential_path
+            if subdir_name + ext in file_names:
+                source_image_path = os.path.join(images_dir, subdir_name + ext)
                 break
             
             # Sometimes the subdir might not match exactly or the extension logic is different.
@@ -147,6 +226,11 @@ def process_directory(dir_path):
             logger.warning(f"Could not compute stats for {subdir_name}")
 
 
+def init_worker(level):
+    # One OpenCV thread per process, the pool already uses every core
+    cv2.setNumThreads(1)
+    logger.setLevel(level)
+
 def worker(root_dir, subdir):
     # logger.info(f"Worker starting for {subdir}")
     full_path = os.path.join(root_dir, subdir)
@@ -154,8 +238,11 @@ def worker(root_dir, subdir):
     # logger.info(f"Worker finished for {subdir}")
 
 def main():
+    # Helper for Windows multiprocessing
+    multiprocessing.freeze_support()
+
     parser = argparse.ArgumentParser(description="Filter photos from documents using heuristics")
-    parser.add_argument("--workers", type=int, default=4, help="Number of worker threads")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose debug logging")
     args = parser.parse_args()
 
@@ -168,14 +255,16 @@ def main():
         return
 
     # List all document directories (001, 002, etc.)
-    subdirs = [d for d in os.listdir(epstein_files_dir) if os.path.isdir(os.path.join(epstein_files_dir, d))]
+    with os.scandir(epstein_files_dir) as it:
+        subdirs = [e.name for e in it if e.is_dir()]
     subdirs.sort()
     
     logger.info(f"Found {len(subdirs)} document directories. Starting processing with {args.workers} workers...")
     
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        for subdir in subdirs:
-            executor.submit(worker, epstein_files_dir, subdir)
+    # np.unique and friends hold the GIL, so use processes rather than threads
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(logger.level,)) as executor:
+        for _ in executor.map(functools.partial(worker, epstein_files_dir), subdirs, chunksize=4):
+            pass
             
     logger.info("All tasks completed.")
 
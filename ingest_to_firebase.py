@@ -1,11 +1,18 @@
 import os
-import json
+import orjson
 import re
+import itertools
+import base64
+import hashlib
+import numpy as np
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 import argparse
-import mimetypes
+import requests
+from google.api_core.exceptions import PreconditionFailed
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+import fast_stat
 
 # Configuration
 CREDENTIALS_PATH = "serviceAccountKey.json"
@@ -14,6 +21,28 @@ COL_DOCUMENTS = "documents"
 COL_IMAGES = "images"
 COL_FACES = "faces"
 STATE_FILE = "epstein_files/ingest_state.json"
+STATE_LOG = STATE_FILE + ".wal" # JSONL of committed updates since the last STATE_FILE snapshot
+MD5_FILE = "md5sums.json" # Per-directory cache of local MD5s, keyed by file name
+STORAGE_PREFIX = "v1/"
+PLAN_META_KEYS = ("link_text", "source_page") # Inventory fields the ingest steps actually read
+# Storage folders each ingest pass uploads into (faces only write to Firestore)
+UPLOAD_PREFIXES = {
+    "documents": STORAGE_PREFIX + "documents/",
+    "images": STORAGE_PREFIX + "images/",
+}
+UPLOAD_WORKERS = 32 # Default concurrent Storage uploads/ACL calls (network-bound, the GIL is released)
+BATCH_SIZE = 500 # Writes between flushes/state checkpoints (BulkWriter batches and pipelines internally)
+WRITE_ATTEMPTS = 15 # Same retry budget as BulkWriter's default error handler
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    from google.cloud.storage import transfer_manager
+except ImportError:
+    transfer_manager = None
 
 # Import Vector for Firestore
 try:
@@ -22,30 +51,105 @@ except ImportError:
     print("Warning: Could not import Vector from google.cloud.firestore_v1.vector. Vector search ingestion will fail.")
     Vector = None
 
+# Blob name -> base64 MD5 of everything already uploaded, filled by load_existing_blobs()
+_existing_blobs = None
+_bucket = None
+# Set by --make-public: grant public read per object (buckets with fine-grained ACLs).
+# By default public read comes from bucket IAM, see README.
+_make_public = False
+# Set by --workers
+_upload_workers = UPLOAD_WORKERS
+# Append handle on STATE_LOG, opened by main()
+_state_log = None
+
+# Extensions we actually upload; anything else is left to the storage client to guess
+CONTENT_TYPES = {
+    ".avif": "image/avif",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+    ".json": "application/json",
+    ".pdf": "application/pdf",
+}
+
 def load_state():
+    state = {"documents": {}, "images": {}, "faces": {}}
     if os.path.exists(STATE_FILE):
         try:
-            with open(STATE_FILE, 'r') as f:
-                state = json.load(f)
+            with open(STATE_FILE, 'rb') as f:
+                state = orjson.loads(f.read())
                 if "faces" not in state:
                     state["faces"] = {}
-                return state
         except:
-            return {"documents": {}, "images": {}, "faces": {}}
-    return {"documents": {}, "images": {}, "faces": {}}
+            state = {"documents": {}, "images": {}, "faces": {}}
+    # Replay anything a previous (crashed) run committed after its last snapshot
+    replay_state_log(state)
+    return state
+
+def replay_state_log(state):
+    if not os.path.exists(STATE_LOG):
+        return 0
+    replayed = 0
+    with open(STATE_LOG, 'rb') as f:
+        for line in f:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # Torn last line from a crash mid-write
+                continue
+            state.setdefault(entry["kind"], {})[entry["id"]] = entry["mtime"]
+            replayed += 1
+    if replayed:
+        print(f"Replayed {replayed} state updates from {STATE_LOG}.")
+    return replayed
+
+def log_state(kind, updates):
+    """
+    Append freshness updates for writes that just committed, one line each,
+    and fsync once per flush so a crash never costs more than the writes in flight.
+    """
+    if _state_log is None or not updates:
+        return
+    for key, mtime in updates.items():
+        _state_log.write(orjson.dumps({"kind": kind, "id": key, "mtime": mtime}, option=orjson.OPT_APPEND_NEWLINE))
+    _state_log.flush()
+    os.fsync(_state_log.fileno())
 
 def save_state(state):
+    """Write the merged snapshot (temp file + rename), then drop the log it now covers."""
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state, f, indent=2)
+        tmp_path = STATE_FILE + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, STATE_FILE)
+        if os.path.exists(STATE_LOG):
+            os.remove(STATE_LOG)
     except Exception as e:
         print(f"Warning: Could not save state: {e}")
 
-def get_max_mtime(paths):
+def scan_dir(path):
+    """
+    name -> DirEntry for one directory listing ({} if it's missing).
+    Existence checks become dict lookups instead of a stat each (slow on the network drive).
+    """
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry for entry in it}
+    except OSError:
+        return {}
+
+def get_max_mtime(entries, names):
+    # Missing files are skipped; fast_stat uses statx without forcing a network drive sync
     max_mtime = 0
-    for p in paths:
-        if os.path.exists(p):
-            mtime = os.path.getmtime(p)
+    for name in names:
+        entry = entries.get(name)
+        if entry is not None:
+            try:
+                mtime = fast_stat.mtime(entry)
+            except OSError:
+                continue # Vanished since the listing
             if mtime > max_mtime:
                 max_mtime = mtime
     return max_mtime
@@ -68,87 +172,422 @@ def initialize_firebase():
         # Fallback if app is already init but client fails? Should not happen with get_app check
         return firestore.client()
 
-def upload_file_to_storage(local_path, destination_path, content_type=None):
-    bucket = storage.bucket()
-    blob = bucket.blob(destination_path)
-    
-    if blob.exists():
-        # print(f"Skipping upload: {destination_path} exists.")
-        return blob.public_url
+def get_bucket():
+    # storage.bucket() rebuilds the client lookup each call; resolve it once (after initialize_app)
+    global _bucket
+    if _bucket is None:
+        _bucket = storage.bucket()
+        # requests keeps 10 connections per host by default; with more upload threads than that,
+        # extra connections get thrown away and every upload pays a new TLS handshake
+        try:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(_upload_workers, 10))
+            _bucket.client._http.mount("https://", adapter)
+        except AttributeError as e:
+            print(f"Warning: Could not resize storage connection pool: {e}")
+    return _bucket
 
-    if not content_type:
-        content_type, _ = mimetypes.guess_type(local_path)
-    
-    blob.upload_from_filename(local_path, content_type=content_type)
-    blob.make_public()
-    print(f"Uploaded: {destination_path}")
-    return blob.public_url
+def load_existing_blobs(prefixes=(STORAGE_PREFIX,)):
+    """
+    One paginated listing per prefix of everything already in the bucket,
+    instead of a blob.exists() HEAD request per file.
+    """
+    global _existing_blobs
+    _existing_blobs = {}
+    for prefix in prefixes:
+        # The listing already carries each object's md5Hash, so comparing needs no reload()
+        for blob in get_bucket().list_blobs(prefix=prefix):
+            _existing_blobs[blob.name] = blob.md5_hash
+    print(f"Found {len(_existing_blobs)} files already in storage.")
 
-def safe_upload(local_path, destination_path, content_type=None):
+def read_json(path):
     """
-    Wrapper for upload_file_to_storage that handles network drive instability.
-    Returns None if upload fails or file is missing.
+    Parsed contents of a small JSON file, or None if it's missing, empty or not valid JSON.
+    Other read errors (flaky network drive) are reported and also give None.
     """
-    if not os.path.exists(local_path):
-        # Double check existence right before upload due to network lag
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Network error reading {path}: {e}")
+        return None
+    if not data:
+        return None
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
         return None
 
+def load_md5s(dir_path):
+    md5s = read_json(os.path.join(dir_path, MD5_FILE))
+    return md5s if isinstance(md5s, dict) else {}
+
+def save_md5s(dir_path, md5s):
     try:
-        return upload_file_to_storage(local_path, destination_path, content_type)
+        with open(os.path.join(dir_path, MD5_FILE), 'wb') as f:
+            f.write(orjson.dumps(md5s))
     except OSError as e:
-        print(f"Network error uploading {local_path}: {e}")
+        print(f"Warning: Could not save {MD5_FILE} in {dir_path}: {e}")
+
+def local_md5(local_path, md5s):
+    """
+    Base64 MD5 of local_path in the same form as blob.md5_hash.
+    md5s caches [size, mtime_ns, md5] per file name so unchanged files aren't re-read.
+    """
+    st = os.stat(local_path)
+    name = os.path.basename(local_path)
+    cached = md5s.get(name)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    with open(local_path, 'rb') as f:
+        md5 = base64.b64encode(hashlib.md5(f.read()).digest()).decode()
+    md5s[name] = [st.st_size, st.st_mtime_ns, md5]
+    return md5
+
+def queue_upload(local_path, destination_path, content_type, uploads, md5s=None):
+    """
+    Queue local_path for upload to destination_path unless an identical copy is already in storage.
+    Appends (local_path, blob) to uploads and returns the public URL,
+    or None if the file is missing (network drive instability).
+    md5s is the directory's MD5 cache (see local_md5); without it only presence is checked.
+    Without the bucket listing every file is queued, and upload_blobs uploads create-only.
+    """
+    if not os.path.exists(local_path):
+        # Double check existence right before upload due to network lag
         return None
+
+    blob = get_bucket().blob(destination_path)
+    
+    # public_url is built locally from the name, no request needed
+    if _existing_blobs is not None:
+        if destination_path in _existing_blobs:
+            remote_md5 = _existing_blobs[destination_path]
+            # Composite objects have no MD5, treat those as up to date
+            if md5s is None or remote_md5 is None:
+                return blob.public_url
+            try:
+                if remote_md5 == local_md5(local_path, md5s):
+                    return blob.public_url
+            except OSError as e:
+                print(f"Network error reading {local_path}: {e}")
+                return None
+
+    if not content_type:
+        content_type = CONTENT_TYPES.get(os.path.splitext(local_path)[1].lower())
+    # upload_from_filename picks this up when no content_type is passed
+    blob.content_type = content_type
+
+    uploads.append((local_path, blob))
+    return blob.public_url
+
+def upload_one(pair, upload_kwargs):
+    local_path, blob = pair
+    try:
+        blob.upload_from_filename(local_path, **upload_kwargs)
     except Exception as e:
-        print(f"Error uploading {local_path}: {e}")
-        return None
+        return e
+    return None
+
+def make_public(blob):
+    try:
+        blob.make_public()
+    except Exception as e:
+        return e
+    return None
+
+def upload_blobs(uploads):
+    """
+    Upload a batch of queued (local_path, blob) pairs in one go, through the
+    transfer manager when available. Returns the names of blobs that failed.
+    """
+    if not uploads:
+        return set()
+
+    # No listing to check against: only create objects (generation 0 = must not exist yet),
+    # an existing one comes back as a 412 instead of costing an exists() request per file
+    upload_kwargs = {"if_generation_match": 0} if _existing_blobs is None else {}
+
+    if transfer_manager is not None:
+        results = transfer_manager.upload_many(
+            uploads, upload_kwargs=upload_kwargs, worker_type=transfer_manager.THREAD,
+            max_workers=_upload_workers, raise_exception=False)
+    else:
+        with ThreadPoolExecutor(max_workers=_upload_workers) as executor:
+            results = list(executor.map(upload_one, uploads, itertools.repeat(upload_kwargs)))
+
+    failed = set()
+    uploaded = []
+    for (local_path, blob), result in zip(uploads, results):
+        if isinstance(result, PreconditionFailed):
+            continue # Already in storage
+        if isinstance(result, Exception):
+            print(f"Error uploading {local_path}: {result}")
+            failed.add(blob.name)
+        else:
+            uploaded.append(blob)
+
+    if _make_public:
+        with ThreadPoolExecutor(max_workers=_upload_workers) as executor:
+            for blob, result in zip(uploaded, executor.map(make_public, uploaded)):
+                if result is not None:
+                    print(f"Error making {blob.name} public: {result}")
+                    failed.add(blob.name)
+
+    for blob in uploaded:
+        if blob.name not in failed:
+            if _existing_blobs is not None:
+                _existing_blobs[blob.name] = blob.md5_hash
+            print(f"Uploaded: {blob.name}")
+    return failed
+
+def new_bulk_writer(db, failed, key_of=None):
+    """
+    BulkWriter that retries like the default handler, and adds the state key of
+    every write it gives up on to failed. key_of maps a document ref to its state key
+    (defaults to the document id). Callbacks run on the writer's threads.
+    """
+    bulk = db.bulk_writer()
+
+    def on_error(failure, _):
+        if failure.attempts < WRITE_ATTEMPTS:
+            return True
+        ref = failure.operation.reference
+        print(f"Write failed for {ref.id}: {failure.message}")
+        failed.add(key_of(ref) if key_of else ref.id)
+        return False
+
+    bulk.on_write_error(on_error)
+    return bulk
+
+def flush_writes(bulk, failed, kind, item_state, updates):
+    """
+    Block until everything queued on bulk is acknowledged, then record updates
+    (state key -> mtime) in item_state and the state log, except keys with a failed write.
+    Only the failures for keys in updates are cleared from failed; the rest (faces of an
+    image still being queued at a mid-image flush) wait for the flush that records that key.
+    Returns the number of keys recorded.
+    """
+    bulk.flush()
+    if failed:
+        recorded = {key: mtime for key, mtime in updates.items() if key not in failed}
+        failed.difference_update(updates)
+        updates = recorded
+    item_state.update(updates)
+    log_state(kind, updates)
+    return len(updates)
+
+def commit_pending(bulk, failed, pending, kind, item_state):
+    """
+    Upload the files queued for a batch of Firestore writes, then write the
+    records whose uploads all succeeded. pending holds (ref, data, key, mtime, uploads).
+    Failed items keep their old mtime in item_state so the next run retries them;
+    acknowledged ones are logged under kind right away.
+    Returns the number of records written.
+    """
+    failed_uploads = upload_blobs([u for *_, uploads in pending for u in uploads])
+    written = {}
+    for ref, data, key, mtime, uploads in pending:
+        if any(blob.name in failed_uploads for _, blob in uploads):
+            print(f"Upload failed for {key}, skipping Firestore update.")
+            continue
+        bulk.set(ref, data, merge=True)
+        written[key] = mtime
+    return flush_writes(bulk, failed, kind, item_state, written)
+
+def compact(data, keep=()):
+    # Leave out empty maps/lists/strings and None values; every stored field costs bytes and index entries.
+    # Fields in keep stay even when None (e.g. page_num, which the site sorts on).
+    return {k: v for k, v in data.items() if k in keep or (v is not None and v != {} and v != [] and v != "")}
+
+def load_face_arrays(img_dir, faces_json):
+    # Newer faces.json files are just an index; bbox/kps/embeddings live in the .npz next to it
+    faces_data = faces_json.get("faces", [])
+    with np.load(os.path.join(img_dir, faces_json["arrays"])) as arrays:
+        # Each arrays[...] lookup re-reads the member from the zip, so convert whole arrays once
+        n = len(faces_data)
+        bboxes = arrays["bboxes"][:n].tolist()
+        # kps come out already flat ([x0, y0, x1, y1, ...]), the layout stored in Firestore
+        kps = arrays["kps"][:n].reshape(n, -1).tolist() if "kps" in arrays.files else None
+        embeddings = arrays["embeddings"][:n].astype(np.float32).tolist() if "embeddings" in arrays.files else None
+    for i, face in enumerate(faces_data):
+        face["bbox"] = bboxes[i]
+        if kps is not None:
+            face["kps"] = kps[i]
+        if embeddings is not None:
+            face["embedding"] = embeddings[i]
+    return faces_data
+
+def iter_inventory(inv_path):
+    """
+    Yield (url, meta) from inventory.json without loading the whole file.
+    plan_documents keeps only the PDF entries.
+    """
+    with open(inv_path, 'rb') as f:
+        if ijson is None:
+            yield from orjson.loads(f.read()).items()
+            return
+        yield from ijson.kvitems(f, '', use_float=True)
+
+def plan_documents(inv_path):
+    """
+    One pass over inventory.json for all three ingest passes.
+    Returns a list of (url, meta, doc_id, file_stem, local_path, output_dir), one per PDF,
+    so the passes don't each re-read the inventory and redo the path math.
+    """
+    records = []
+    for url, meta in iter_inventory(inv_path):
+        local_path = meta.get("local_path")
+        # We only care about PDFs, everything else hangs off their document folder
+        if not local_path or not local_path.lower().endswith('.pdf'):
+            continue
+        
+        # Determine Doc ID from filename stem for consistency
+        file_stem = os.path.splitext(os.path.basename(local_path))[0]
+        doc_id = meta.get("id") or file_stem
+        output_dir = os.path.join(os.path.dirname(local_path), file_stem)
+        # Keep only what's used so the plan stays small while the inventory streams past
+        meta = {key: meta.get(key) for key in PLAN_META_KEYS}
+        records.append((url, meta, doc_id, file_stem, local_path, output_dir))
+    return records
+
+def list_image_dirs(output_dir, cache):
+    """
+    (img_name, img_dir) for each extracted image folder under output_dir/images.
+    cache keeps the listing so the images and faces passes only scan images/ once.
+    """
+    dirs = cache.get(output_dir)
+    if dirs is None:
+        # A missing images folder just lists as empty
+        images_root = os.path.join(output_dir, "images")
+        dirs = cache[output_dir] = [(name, entry.path) for name, entry in scan_dir(images_root).items() if entry.is_dir()]
+    return dirs
+
+def prefetch_image_dirs(output_dirs, cache):
+    """
+    Fill cache with the images/ listings for output_dirs on a thread pool.
+    Each listing is a network round trip, overlapping them hides the latency.
+    """
+    todo = [d for d in output_dirs if d not in cache]
+    if not todo:
+        return
+    with ThreadPoolExecutor(max_workers=_upload_workers) as executor:
+        # list_image_dirs only assigns its own key, so sharing the dict across threads is fine
+        for _ in executor.map(lambda d: list_image_dirs(d, cache), todo):
+            pass
+
+PAGE_NUM_RE = re.compile(r'page(\d+)')
 
 def parse_page_num(img_name):
     # e.g. "page11_img1" -> 11
-    match = re.search(r'page(\d+)', img_name)
+    # extract_content always names images page{N}_img{M}, so that case is a plain split
+    if img_name.startswith("page"):
+        digits = img_name[4:].partition("_")[0]
+        if digits.isdecimal():
+            return int(digits)
+    match = PAGE_NUM_RE.search(img_name)
     if match:
         return int(match.group(1))
     return None
 
-def ingest_documents(db, inventory, state, force=False):
+def prepare_document(task):
+    """
+    Queue previews/text for one document and build its Firestore data.
+    Runs on a thread pool (file checks can be slow on the network drive).
+    Returns (doc_id, doc_data or None, mtime, uploads).
+    """
+    url, meta, doc_id, local_path, output_dir, current_mtime, entries = task
+    file_stem = os.path.splitext(os.path.basename(local_path))[0]
+    medium_path = os.path.join(output_dir, "medium.avif")
+    thumb_path = os.path.join(output_dir, "thumb.avif")
+
+    # Upload
+    storage_path_m = f"v1/documents/{doc_id}/medium.avif"
+    storage_path_t = f"v1/documents/{doc_id}/thumb.avif"
+    uploads = []
+    md5s = load_md5s(output_dir)
+    old_md5s = dict(md5s)
+    
+    url_m = queue_upload(medium_path, storage_path_m, "image/avif", uploads, md5s)
+    url_t = queue_upload(thumb_path, storage_path_t, "image/avif", uploads, md5s)
+    
+    # Text/Markdown Integration
+    content_map = {}
+    ocr_map = {}
+    
+    for name in ["content.txt", "content.md", "ocr.txt", "ocr.md"]:
+         if name in entries:
+             local_f = entries[name].path
+             storage_f = f"v1/documents/{doc_id}/{name}"
+             # Use text/plain or text/markdown
+             ctype = "text/markdown" if name.endswith(".md") else "text/plain"
+             url_f = queue_upload(local_f, storage_f, ctype, uploads, md5s)
+             
+             if url_f:
+                 if name.startswith("content"):
+                     key = "markdown_url" if name.endswith(".md") else "text_url"
+                     content_map[key] = url_f
+                 elif name.startswith("ocr"):
+                     key = "markdown_url" if name.endswith(".md") else "text_url"
+                     ocr_map[key] = url_f
+
+    if md5s != old_md5s:
+        save_md5s(output_dir, md5s)
+    
+    if not url_m or not url_t:
+         print(f"Missing previews for {doc_id}, skipping Firestore update.")
+         return doc_id, None, current_mtime, uploads
+    
+    # Doc Info Data
+    info_data = {}
+    if "info.json" in entries:
+        info_data = read_json(entries["info.json"].path) or {}
+        
+    # Data
+    doc_data = compact({
+        "title": meta.get("link_text") or file_stem,
+        "url": url, # The Direct PDF URL
+        "source_page": meta.get("source_page"), # The Web Page URL
+        "preview_medium": url_m,
+        "preview_thumb": url_t,
+        "filename": os.path.basename(local_path),
+        "content": content_map,
+        "ocr": ocr_map,
+        "info": info_data,
+        "ingested_at": firestore.SERVER_TIMESTAMP
+    })
+    
+    return doc_id, doc_data, current_mtime, uploads
+
+def ingest_documents(db, records, state, force=False, quick=False):
     print("\n--- Ingesting Documents ---")
     count = 0
     skipped_count = 0
-    batch = db.batch()
-    batch_count = 0
     
     doc_state = state.get("documents", {})
-    pending_updates = {}
-
-    for url, meta in inventory.items():
-        local_path = meta.get("local_path")
-        if not local_path: 
-            continue
-            
-        # We only care about PDFs for the document collection
-        if not local_path.lower().endswith('.pdf'):
-            continue
-            
-        # Determine Doc ID from filename stem for consistency
-        doc_id = meta.get("id")
-        if not doc_id:
-             doc_id = os.path.splitext(os.path.basename(local_path))[0]
+    pending = [] # (ref, data, doc_id, mtime, uploads) waiting for the next batch
+    failed = set()
+    bulk = new_bulk_writer(db, failed)
+    doc_tasks = []
 
+    for url, meta, doc_id, file_stem, local_path, output_dir in records:
         # The document folder is where the PDF lives, but our previews are in 
         # epstein_files/DOCNAME/medium.avif
         # Actually, `process_images` outputs to:
-        # file_dir/file_stem/medium.avif
+        # file_dir/file_stem/medium.avif (output_dir)
         
-        file_stem = os.path.splitext(os.path.basename(local_path))[0]
-        file_dir = os.path.dirname(local_path)
-        output_dir = os.path.join(file_dir, file_stem)
+        # --quick with an unchanged inventory: anything ingested before is taken as current
+        if quick and doc_id in doc_state:
+            skipped_count += 1
+            continue
         
-        medium_path = os.path.join(output_dir, "medium.avif")
-        thumb_path = os.path.join(output_dir, "thumb.avif")
+        # One listing answers every exists/mtime question below
+        entries = scan_dir(output_dir)
         
         # If we don't have previews, we might still want to ingest the metadata?
         # User said "upload their medium.avif and thumb.avif images".
         # So if they don't exist, we skip or mark as pending. Let's skip for now to keep it clean.
-        if not os.path.exists(medium_path):
+        if "medium.avif" not in entries or "thumb.avif" not in entries:
             continue
             
         # Check freshness EARLY to skip uploads
@@ -158,262 +597,197 @@ def ingest_documents(db, inventory, state, force=False):
         # - The content/ocr text files
         # - The info.json
         
-        info_path = os.path.join(output_dir, "info.json")
-        
-        check_paths = [local_path, medium_path, thumb_path, info_path]
-        for name in ["content.txt", "content.md", "ocr.txt", "ocr.md"]:
-             check_paths.append(os.path.join(output_dir, name))
-             
-        current_mtime = get_max_mtime(check_paths)
+        current_mtime = get_max_mtime(entries, ["medium.avif", "thumb.avif", "info.json",
+                                                "content.txt", "content.md", "ocr.txt", "ocr.md"])
+        try:
+            current_mtime = max(current_mtime, fast_stat.mtime(local_path))
+        except OSError:
+            pass
         last_mtime = doc_state.get(doc_id, 0)
         
         if not force and current_mtime <= last_mtime:
             skipped_count += 1
             continue
 
-        # Upload
-        storage_path_m = f"v1/documents/{doc_id}/medium.avif"
-        storage_path_t = f"v1/documents/{doc_id}/thumb.avif"
-        
-        if not os.path.exists(thumb_path):
-            continue
+        doc_tasks.append((url, meta, doc_id, local_path, output_dir, current_mtime, entries))
 
-        url_m = safe_upload(medium_path, storage_path_m, "image/avif")
-        url_t = safe_upload(thumb_path, storage_path_t, "image/avif")
-        
-        # Text/Markdown Integration
-        content_map = {}
-        ocr_map = {}
-        
-        for name in ["content.txt", "content.md", "ocr.txt", "ocr.md"]:
-             local_f = os.path.join(output_dir, name)
-             if os.path.exists(local_f):
-                 storage_f = f"v1/documents/{doc_id}/{name}"
-                 # Use text/plain or text/markdown
-                 ctype = "text/markdown" if name.endswith(".md") else "text/plain"
-                 url_f = safe_upload(local_f, storage_f, ctype)
-                 
-                 if url_f:
-                     if name.startswith("content"):
-                         key = "markdown_url" if name.endswith(".md") else "text_url"
-                         content_map[key] = url_f
-                     elif name.startswith("ocr"):
-                         key = "markdown_url" if name.endswith(".md") else "text_url"
-                         ocr_map[key] = url_f
-        
-        if not url_m or not url_t:
-             print(f"Failed to upload previews for {doc_id}, skipping Firestore update.")
-             continue
-        
-        # Doc Info Data
-        # info_path defined above
-        info_data = {}
-        if os.path.exists(info_path):
-            try:
-                with open(info_path, 'r') as f:
-                    info_data = json.load(f)
-            except: pass
-            
-        # Data
-        doc_data = {
-            "title": meta.get("link_text") or file_stem,
-            "url": url, # The Direct PDF URL
-            "source_page": meta.get("source_page"), # The Web Page URL
-            "preview_medium": url_m,
-            "preview_thumb": url_t,
-            "filename": os.path.basename(local_path),
-            "content": content_map,
-            "ocr": ocr_map,
-            "info": info_data,
-            "ingested_at": firestore.SERVER_TIMESTAMP
-        }
-        
-        # Upsert
-        ref = db.collection(COL_DOCUMENTS).document(doc_id)
-        batch.set(ref, doc_data, merge=True)
-        batch_count += 1
-        count += 1
-        
-        # Track pending update
-        pending_updates[doc_id] = current_mtime
+    # Files are queued per document, then each batch's uploads go out together
+    # before its Firestore writes are committed here in order.
+    with ThreadPoolExecutor(max_workers=_upload_workers) as executor:
+        for doc_id, doc_data, current_mtime, uploads in executor.map(prepare_document, doc_tasks):
+            if doc_data is None:
+                continue
+
+            # Upsert
+            ref = db.collection(COL_DOCUMENTS).document(doc_id)
+            pending.append((ref, doc_data, doc_id, current_mtime, uploads))
         
-        if batch_count >= 10:
-            batch.commit()
-            batch = db.batch()
-            batch_count = 0
-            print(f"Committed batch of documents.")
-            
-            doc_state.update(pending_updates)
-            pending_updates = {}
+            if len(pending) >= BATCH_SIZE:
+                committed = commit_pending(bulk, failed, pending, "documents", doc_state)
+                count += committed
+                pending = []
+                print(f"Committed batch of {committed} documents.")
 
-    if batch_count > 0:
-        batch.commit()
-        doc_state.update(pending_updates)
+    if pending:
+        count += commit_pending(bulk, failed, pending, "documents", doc_state)
+    bulk.close()
     
     # Save state back to main dict (in memory mainly, but good practice)
     state["documents"] = doc_state
         
     print(f"Documents Ingested: {count} (Skipped: {skipped_count})")
 
-def ingest_images(db, inventory, state, args=None):
+def prepare_image(task):
+    """
+    Queue previews/OCR for one extracted image and build its Firestore data.
+    Runs on a thread pool like prepare_document.
+    Returns (db_id, img_data or None, mtime, uploads).
+    """
+    url, meta, doc_id, img_name, img_dir, db_id, eval_data, current_mtime, entries = task
+    medium_path = os.path.join(img_dir, "medium.avif")
+    thumb_path = os.path.join(img_dir, "thumb.avif")
+
+    storage_path_m = f"v1/images/{doc_id}/{img_name}/medium.avif"
+    storage_path_t = f"v1/images/{doc_id}/{img_name}/thumb.avif"
+    uploads = []
+    md5s = load_md5s(img_dir)
+    old_md5s = dict(md5s)
+    
+    url_m = queue_upload(medium_path, storage_path_m, "image/avif", uploads, md5s)
+    url_t = queue_upload(thumb_path, storage_path_t, "image/avif", uploads, md5s)
+
+    # Text/Markdown Integration for Images
+    ocr_map = {}
+    for name in ["ocr.txt", "ocr.md"]:
+         if name in entries:
+             local_f = entries[name].path
+             storage_f = f"v1/images/{doc_id}/{img_name}/{name}"
+             ctype = "text/markdown" if name.endswith(".md") else "text/plain"
+             url_f = queue_upload(local_f, storage_f, ctype, uploads, md5s)
+             if url_f:
+                 key = "markdown_url" if name.endswith(".md") else "text_url"
+                 ocr_map[key] = url_f
+
+    if md5s != old_md5s:
+        save_md5s(img_dir, md5s)
+
+    # Analysis Data
+    analysis_data = {}
+    if "analysis.json" in entries:
+        analysis_data = read_json(entries["analysis.json"].path) or {} # analysis_data might be empty
+    
+    if not url_m or not url_t:
+         return db_id, None, current_mtime, uploads
+    
+    # Construct ID
+    # "https://.../001.pdf#page11_img1"
+    unique_uri = f"{url}#{img_name}"
+    
+    # Page Number
+    page_num = parse_page_num(img_name)
+    
+    # page_num stays even when None: the document page orders its images by it,
+    # and Firestore drops documents missing the field from that query
+    img_data = compact({
+        "unique_uri": unique_uri,
+        "parent_doc_id": doc_id,
+        "parent_doc_url": url,
+        "source_page_url": meta.get("source_page"),
+        "page_num": page_num,
+        "preview_medium": url_m,
+        "preview_thumb": url_t,
+        "image_name": img_name,
+        "eval": eval_data,
+        "ocr": ocr_map,
+        "analysis": analysis_data,
+        "ingested_at": firestore.SERVER_TIMESTAMP
+    }, keep=("page_num",))
+    
+    return db_id, img_data, current_mtime, uploads
+
+def ingest_images(db, records, state, args=None, image_dirs=None, quick=False):
     force = args.force if args else False
     print("\n--- Ingesting Extracted Photos ---")
     count = 0
     skipped_count = 0
-    batch = db.batch()
-    batch_count = 0
     
     img_state = state.get("images", {})
     
-    pending_updates = {}
-    
-    for url, meta in inventory.items():
-        local_path = meta.get("local_path")
-        if not local_path or not local_path.lower().endswith('.pdf'):
-            continue
-            
-        file_stem = os.path.splitext(os.path.basename(local_path))[0]
-        doc_id = meta.get("id") or file_stem
+    pending = [] # (ref, data, db_id, mtime, uploads) waiting for the next batch
+    failed = set()
+    bulk = new_bulk_writer(db, failed)
+    img_tasks = []
+    if image_dirs is None:
+        image_dirs = {}
 
-        if hasattr(args, 'doc') and args.doc:
-            target_docs = args.doc.split(',')
-            # Normalize to strings just in case
-            target_docs = [str(x).strip() for x in target_docs]
-            if str(doc_id) not in target_docs and str(file_stem) not in target_docs:
-                continue
-        file_dir = os.path.dirname(local_path)
+    target_docs = None
+    if hasattr(args, 'doc') and args.doc:
+        # Normalize to strings just in case
+        target_docs = [str(x).strip() for x in args.doc.split(',')]
+    
+    if target_docs:
+        records = [r for r in records if str(r[2]) in target_docs or str(r[3]) in target_docs]
+    prefetch_image_dirs([r[5] for r in records], image_dirs)
+    
+    for url, meta, doc_id, file_stem, local_path, output_dir in records:
         
         # Extracted images are in: epstein_files/DOCID/images/IMGNAME/...
-        images_root = os.path.join(file_dir, file_stem, "images")
-        
-        if not os.path.exists(images_root):
-            continue
-            
-        doc_id = meta.get("id") or file_stem
-        
-        for img_name in os.listdir(images_root):
-            img_dir = os.path.join(images_root, img_name)
-            if not os.path.isdir(img_dir):
-                continue
-                
-            # Filter: Check eval.json
-            eval_path = os.path.join(img_dir, "eval.json")
-            if not os.path.exists(eval_path):
-                continue
-                
-            try:
-                with open(eval_path, 'r') as f:
-                    eval_data = json.load(f)
-                    # We accept all analyzed images now, regardless of photo score
-                    # if not eval_data.get("is_likely_photo"):
-                    #     continue
-            except:
+        for img_name, img_dir in list_image_dirs(output_dir, image_dirs):
+            # Construct DB ID early for state check
+            db_id = f"{doc_id}_{img_name}"
+            if quick and db_id in img_state:
+                skipped_count += 1
                 continue
-
-            # Found a photo! Upload previews.
-            medium_path = os.path.join(img_dir, "medium.avif")
-            thumb_path = os.path.join(img_dir, "thumb.avif")
-            analysis_path = os.path.join(img_dir, "analysis.json")
             
-            if not os.path.exists(medium_path):
+            entries = scan_dir(img_dir)
+                
+            # Filter: needs eval.json and both previews (all from the one listing)
+            if "eval.json" not in entries or "medium.avif" not in entries or "thumb.avif" not in entries:
                 continue
 
-            # Check freshness EARLY
-            check_paths = [medium_path, thumb_path, analysis_path, eval_path]
-            for name in ["ocr.txt", "ocr.md"]:
-                 check_paths.append(os.path.join(img_dir, name))
-                 
-            current_mtime = get_max_mtime(check_paths)
+            # Check freshness EARLY, before reading anything
+            current_mtime = get_max_mtime(entries, ["medium.avif", "thumb.avif", "analysis.json",
+                                                    "eval.json", "ocr.txt", "ocr.md"])
             
-            # Construct DB ID early for state check
-            db_id = f"{doc_id}_{img_name}"
             last_mtime = img_state.get(db_id, 0)
             
             if not force and current_mtime <= last_mtime:
                 skipped_count += 1
                 continue
-                
-            storage_path_m = f"v1/images/{doc_id}/{img_name}/medium.avif"
-            storage_path_t = f"v1/images/{doc_id}/{img_name}/thumb.avif"
-            
-            if not os.path.exists(thumb_path):
+
+            eval_data = read_json(entries["eval.json"].path)
+            if eval_data is None:
+                continue
+            # We accept all analyzed images now, regardless of photo score
+            # if not eval_data.get("is_likely_photo"):
+            #     continue
+
+            img_tasks.append((url, meta, doc_id, img_name, img_dir, db_id, eval_data, current_mtime, entries))
+
+    # Same as documents: one transfer per batch, Firestore writes stay on this thread
+    with ThreadPoolExecutor(max_workers=_upload_workers) as executor:
+        for db_id, img_data, current_mtime, uploads in executor.map(prepare_image, img_tasks):
+            if img_data is None:
                 continue
 
-            url_m = safe_upload(medium_path, storage_path_m, "image/avif")
-            url_t = safe_upload(thumb_path, storage_path_t, "image/avif")
-
-            # Text/Markdown Integration for Images
-            ocr_map = {}
-            for name in ["ocr.txt", "ocr.md"]:
-                 local_f = os.path.join(img_dir, name)
-                 if os.path.exists(local_f):
-                     storage_f = f"v1/images/{doc_id}/{img_name}/{name}"
-                     ctype = "text/markdown" if name.endswith(".md") else "text/plain"
-                     url_f = safe_upload(local_f, storage_f, ctype)
-                     if url_f:
-                         key = "markdown_url" if name.endswith(".md") else "text_url"
-                         ocr_map[key] = url_f
-
-            # Analysis Data
-            # analysis_path defined above
-            analysis_data = {}
-            if os.path.exists(analysis_path):
-                try: 
-                    with open(analysis_path, 'r') as f:
-                        analysis_data = json.load(f)
-                except: pass # analysis_data might be empty
-            
-            if not url_m or not url_t:
-                 continue
-            
-            # Construct ID
-            # "https://.../001.pdf#page11_img1"
-            unique_uri = f"{url}#{img_name}"
-            
-            # Page Number
-            page_num = parse_page_num(img_name)
-            
-            img_data = {
-                "unique_uri": unique_uri,
-                "parent_doc_id": doc_id,
-                "parent_doc_url": url,
-                "source_page_url": meta.get("source_page"),
-                "page_num": page_num,
-                "preview_medium": url_m,
-                "preview_thumb": url_t,
-                "image_name": img_name,
-                "eval": eval_data,
-                "ocr": ocr_map,
-                "analysis": analysis_data,
-                "ingested_at": firestore.SERVER_TIMESTAMP
-            }
-            
             ref = db.collection(COL_IMAGES).document(db_id)
-            batch.set(ref, img_data, merge=True)
-            batch_count += 1
-            count += 1
-            
-            # Track pending update
-            pending_updates[db_id] = current_mtime
-            
-            if batch_count >= 10:
-                batch.commit()
-                batch = db.batch()
-                batch_count = 0
-                print(f"Committed batch of images.")
-                
-                img_state.update(pending_updates)
-                pending_updates = {}
+            pending.append((ref, img_data, db_id, current_mtime, uploads))
+        
+            if len(pending) >= BATCH_SIZE:
+                committed = commit_pending(bulk, failed, pending, "images", img_state)
+                count += committed
+                pending = []
+                print(f"Committed batch of {committed} images.")
 
-    if batch_count > 0:
-        batch.commit()
-        img_state.update(pending_updates)
+    if pending:
+        count += commit_pending(bulk, failed, pending, "images", img_state)
+    bulk.close()
         
     state["images"] = img_state
 
     print(f"Images Ingested: {count} (Skipped: {skipped_count})")
 
-def ingest_faces(db, inventory, state, force=False):
+def ingest_faces(db, records, state, force=False, image_dirs=None, quick=False):
     if not Vector:
         print("\n--- Ingesting Faces (SKIPPED due to missing Vector class) ---")
         return
@@ -421,44 +795,43 @@ def ingest_faces(db, inventory, state, force=False):
     print("\n--- Ingesting Faces ---")
     count = 0
     skipped_count = 0
-    batch = db.batch()
-    batch_count = 0
+    failed = set()
+    # Face ids are <image key>_<n>; a failed face holds back its whole image
+    bulk = new_bulk_writer(db, failed, key_of=lambda ref: ref.id.rsplit('_', 1)[0])
+    batch_count = 0 # Faces queued since the last flush
     
     face_state = state.get("faces", {})
     pending_updates = {}
+    image_count = 0
+    if image_dirs is None:
+        image_dirs = {}
+
+    prefetch_image_dirs([r[5] for r in records], image_dirs)
 
     # Iterate through extracted images logic again to find faces.json
-    for i, (url, meta) in enumerate(inventory.items()):
+    for i, (url, meta, doc_id, file_stem, local_path, output_dir) in enumerate(records):
         if i % 10 == 0:
-            print(f"Scanned {i}/{len(inventory)} documents...", end='\r')
-            
-        local_path = meta.get("local_path")
-        if not local_path or not local_path.lower().endswith('.pdf'):
-            continue
-            
-        file_stem = os.path.splitext(os.path.basename(local_path))[0]
-        file_dir = os.path.dirname(local_path)
-        images_root = os.path.join(file_dir, file_stem, "images")
-        
-        if not os.path.exists(images_root):
-             continue
-             
-        doc_id = meta.get("id") or file_stem
+            print(f"Scanned {i} documents...", end='\r')
         
-        for img_name in os.listdir(images_root):
-            img_dir = os.path.join(images_root, img_name)
-            if not os.path.isdir(img_dir):
+        for img_name, img_dir in list_image_dirs(output_dir, image_dirs):
+            # Using doc_id + img_name to track freshness of faces.json processing
+            # This is slightly simplified (if faces.json changes, we re-ingest all faces for that image)
+            sync_key = f"{doc_id}_{img_name}"
+            if quick and sync_key in face_state:
+                skipped_count += 1
                 continue
+            
+            entries = scan_dir(img_dir)
                 
             faces_path = os.path.join(img_dir, "faces.json")
-            if not os.path.exists(faces_path):
+            if "faces.json" not in entries:
                 continue
                 
-            current_mtime = os.path.getmtime(faces_path)
+            try:
+                current_mtime = fast_stat.mtime(entries["faces.json"])
+            except OSError:
+                continue
             
-            # Using doc_id + img_name to track freshness of faces.json processing
-            # This is slightly simplified (if faces.json changes, we re-ingest all faces for that image)
-            sync_key = f"{doc_id}_{img_name}"
             last_mtime = face_state.get(sync_key, 0)
             
             if not force and current_mtime <= last_mtime:
@@ -468,13 +841,16 @@ def ingest_faces(db, inventory, state, force=False):
                 continue
             
             try:
-                with open(faces_path, 'r') as f:
-                    faces_json = json.load(f)
+                with open(faces_path, 'rb') as f:
+                    faces_json = orjson.loads(f.read())
                     
                 # Handle both list (legacy) and dict (new) formats
                 if isinstance(faces_json, list):
                     faces_data = faces_json
                     source_dims = None
+                elif isinstance(faces_json, dict) and faces_json.get("arrays"):
+                    faces_data = load_face_arrays(img_dir, faces_json)
+                    source_dims = faces_json.get("source_dimensions")
                 elif isinstance(faces_json, dict):
                     faces_data = faces_json.get("faces", [])
                     source_dims = faces_json.get("source_dimensions")
@@ -491,6 +867,7 @@ def ingest_faces(db, inventory, state, force=False):
             # We found faces to ingest.
             # Parent Image Reference
             image_db_id = f"{doc_id}_{img_name}"
+            page_num = parse_page_num(img_name) # Same for every face in the image
             
             # Determine image dimensions for normalization
             im_width = 0
@@ -506,13 +883,13 @@ def ingest_faces(db, inventory, state, force=False):
             if source_dims:
                 im_width = source_dims.get("width", 0)
                 im_height = source_dims.get("height", 0)
-            elif os.path.exists(os.path.join(img_dir, "full.avif")):
+            elif "full.avif" in entries:
                 dim_source = os.path.join(img_dir, "full.avif")
             else:
                 # Try original extensions in parent dir
                 pass 
                 
-            if not source_dims and not dim_source and os.path.exists(os.path.join(img_dir, "medium.avif")):
+            if not source_dims and not dim_source and "medium.avif" in entries:
                  dim_source = os.path.join(img_dir, "medium.avif")
                  
             if dim_source:
@@ -537,11 +914,11 @@ def ingest_faces(db, inventory, state, force=False):
                 if not embedding:
                     continue
 
-                # Fix nested arrays for Firestore (kps is [[x,y], ...])
+                # Firestore rejects nested arrays; store kps flat as [x0, y0, x1, y1, ...]
                 kps = face.get("kps")
-                if kps and isinstance(kps, list):
-                    # Convert to list of objects: [{'x': 1, 'y': 2}, ...]
-                    kps = [{'x': p[0], 'y': p[1]} for p in kps if len(p) >= 2]
+                if kps and isinstance(kps, list) and isinstance(kps[0], list):
+                    # Legacy faces.json: [[x, y], ...]
+                    kps = list(itertools.chain.from_iterable(p[:2] for p in kps if len(p) >= 2))
                     
                 # Normalize BBox if we have dimensions
                 bbox = face.get("bbox") # [x1, y1, x2, y2]
@@ -556,7 +933,7 @@ def ingest_faces(db, inventory, state, force=False):
                         ]
 
                 # Store
-                face_doc = {
+                face_doc = compact({
                     "parent_image_id": image_db_id,
                     "parent_doc_id": doc_id,
                     "bbox": bbox, # [x1, y1, x2, y2]
@@ -565,37 +942,36 @@ def ingest_faces(db, inventory, state, force=False):
                     "embedding": Vector(embedding), # Create Vector object
                     "image_name": img_name,
                     "doc_title": meta.get("link_text") or file_stem,
-                    "page_num": parse_page_num(img_name),
+                    "page_num": page_num,
                     "ingested_at": firestore.SERVER_TIMESTAMP
-                }
+                })
                 
                 ref = db.collection(COL_FACES).document(face_id)
-                batch.set(ref, face_doc, merge=True)
+                bulk.set(ref, face_doc, merge=True)
                 batch_count += 1
                 count += 1
                 
-                if batch_count >= 10:
-                    batch.commit()
-                    print(f"    Committed batch of 10 faces (Total: {count})")
-                    batch = db.batch()
+                if batch_count >= BATCH_SIZE:
+                    # Images finished before this one are fully written once this returns
+                    image_count += flush_writes(bulk, failed, "faces", face_state, pending_updates)
+                    print(f"    Committed batch of {BATCH_SIZE} faces (Total: {count})")
                     batch_count = 0
+                    pending_updates = {}
             
             # Track as updated
             pending_updates[sync_key] = current_mtime
             
-            if batch_count >= 10: # Check again after loop
-                 batch.commit()
-                 print(f"    Committed batch of 10 faces (Total: {count})")
-                 batch = db.batch()
+            if batch_count >= BATCH_SIZE: # Check again after loop
+                 image_count += flush_writes(bulk, failed, "faces", face_state, pending_updates)
+                 print(f"    Committed batch of {BATCH_SIZE} faces (Total: {count})")
                  batch_count = 0
+                 pending_updates = {}
                  
-    if batch_count > 0:
-        batch.commit()
-    
-    face_state.update(pending_updates)
+    image_count += flush_writes(bulk, failed, "faces", face_state, pending_updates)
+    bulk.close()
     state["faces"] = face_state
     
-    print(f"Faces Ingested: {count} (from {len(pending_updates)} images, Skipped {skipped_count} images)")
+    print(f"Faces Ingested: {count} (from {image_count} images, Skipped {skipped_count} images)")
 
 
 def main():
@@ -603,8 +979,15 @@ def main():
     parser.add_argument("--only", choices=["documents", "images", "faces"], help="Ingest only specific entity type.")
     parser.add_argument("--doc", help="Ingest only a specific document ID (or comma-separated list).")
     parser.add_argument("--force", action="store_true", help="Force re-ingestion of all files, ignoring state.")
+    parser.add_argument("--quick", action="store_true", help="If inventory.json is unchanged since the last run, skip everything already ingested without checking its files.")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help="Concurrent Storage uploads and file checks.")
+    parser.add_argument("--make-public", action="store_true", help="Call make_public() on each uploaded file (only needed if the bucket doesn't grant allUsers objectViewer).")
     args = parser.parse_args()
 
+    global _make_public, _upload_workers, _state_log
+    _make_public = args.make_public
+    _upload_workers = max(1, args.workers)
+
     db = initialize_firebase()
     if not db:
         return
@@ -614,22 +997,45 @@ def main():
         print("Inventory not found.")
         return
         
-    with open(inv_path, 'r') as f:
-        inventory = json.load(f)
-        
     state = load_state()
+
+    # Only list the folders this run will upload into
+    prefixes = [UPLOAD_PREFIXES[args.only]] if args.only in UPLOAD_PREFIXES else list(UPLOAD_PREFIXES.values())
+    try:
+        if args.only != 'faces':
+            load_existing_blobs(prefixes)
+    except Exception as e:
+        # Fall back to create-only uploads (see upload_blobs)
+        print(f"Warning: Could not list existing storage files: {e}")
         
+    # --quick trusts state for known records when the inventory hasn't changed since the last full run
+    inv_mtime = os.path.getmtime(inv_path)
+    quick = args.quick and not args.force and inv_mtime <= state.get("inventory_mtime", 0)
+    if args.quick and not quick:
+        print("Inventory changed since the last run, checking every record.")
+
+    # One inventory pass shared by every ingest step
+    records = plan_documents(inv_path)
+    image_dirs = {} # images/ listings, shared by the images and faces steps
+    print(f"Found {len(records)} documents in inventory.")
+
+    _state_log = open(STATE_LOG, 'ab')
     try:
         if not args.only or args.only == 'documents':
-            ingest_documents(db, inventory, state, args.force)
+            ingest_documents(db, records, state, args.force, quick)
             
         if not args.only or args.only == 'images':
-            ingest_images(db, inventory, state, args)
+            ingest_images(db, records, state, args, image_dirs, quick)
 
         if not args.only or args.only == 'faces':
-            ingest_faces(db, inventory, state, args.force)
+            ingest_faces(db, records, state, args.force, image_dirs, quick)
+
+        if not args.only and not args.doc:
+            state["inventory_mtime"] = inv_mtime
             
     finally:
+        _state_log.close()
+        _state_log = None
         save_state(state)
 
 if __name__ == "__main__":
@@ -0,0 +1,19 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shared by the OCR scripts that talk to LM Studio.
+
+def new_session(pool_size=1):
+    """
+    Keep-alive session for the LM Studio calls (pool_size connections, one per concurrent
+    request, instead of a new one per request), retrying connection errors and 502/503/504
+    with backoff so a model reload doesn't fail pages.
+    """
+    retry = Retry(total=5, backoff_factor=1.0, status_forcelist=[502, 503, 504],
+                  allowed_methods=frozenset(["POST"]), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
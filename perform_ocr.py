@@ -1,8 +1,9 @@
 import os
 import json
+import orjson
 import base64
-import requests
 import argparse
+from lm_session import new_session
 
 # Configuration
 #LM_STUDIO_URL = "http://127.0.0.1:1234/v1/chat/completions"
@@ -13,6 +14,8 @@ ROOT_DIR = "epstein_files"
 from PIL import Image
 import io
 
+_session = new_session() # One request at a time, so one connection
+
 def get_base64_encoded_image(image_path):
     # Convert to JPEG for consistency and API compatibility
     with Image.open(image_path) as img:
@@ -29,7 +32,8 @@ def get_base64_encoded_image(image_path):
 
         buffer = io.BytesIO()
         img.save(buffer, format="JPEG")
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # getbuffer() is a view, getvalue() would copy the whole JPEG first
+        return base64.b64encode(buffer.getbuffer()).decode('ascii')
 
 def perform_ocr(image_path):
     try:
@@ -61,10 +65,11 @@ def perform_ocr(image_path):
             "max_tokens": 2000 
         }
 
-        response = requests.post(LM_STUDIO_URL, headers=headers, json=payload)
+        # orjson encodes the multi-MB base64 string straight to bytes (requests' json= goes str -> bytes)
+        response = _session.post(LM_STUDIO_URL, headers=headers, data=orjson.dumps(payload))
         response.raise_for_status() # Raise an error for bad status codes
         
-        result = response.json()
+        result = orjson.loads(response.content)
         return result['choices'][0]['message']['content']
 
     except Exception as e:
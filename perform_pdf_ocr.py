@@ -1,17 +1,20 @@
 import os
-import json
+import orjson
 import base64
-import requests
 import argparse
-import io
+from lm_session import new_session
 import fitz  # PyMuPDF
-from PIL import Image
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration
 LM_STUDIO_URL = "http://192.168.7.142:1234/v1/chat/completions"
 MODEL_NAME = "allenai/olmocr-2-7b"
 ROOT_DIR = "epstein_files"
 TARGET_LONG_SIDE = 1288
+PAGE_IMAGE_FORMAT = "jpeg" # Sent to the model; "png" is lossless but several times the upload
+JPEG_QUALITY = 85
+OCR_WORKERS = 2 # Pages in flight to LM Studio at once (match its parallel request slots)
 
 SYSTEM_PROMPT = """You are an expert document OCR transcriber. Transcribe the entire page content exactly as Markdown. Preserve:
 - Reading order
@@ -23,42 +26,25 @@ SYSTEM_PROMPT = """You are an expert document OCR transcriber. Transcribe the en
 - Layout structure as best as possible
 Output ONLY the clean Markdown, no explanations."""
 
+# Shared by the OCR threads, main() resizes the pool to --workers
+_session = new_session(OCR_WORKERS)
+
 def get_page_image_base64(page):
     """
-    Renders a PyMuPDF page to a PNG image with the longest side approx 1288px.
+    Renders a PyMuPDF page straight to an encoded image with the longest side TARGET_LONG_SIDE px.
     Returns base64 encoded string.
     """
-    # 1. Calculate zoom to get high quality source
-    # We want final output ~1288. Let's render at 144dpi (~2.0 scale) or higher first, then downscale cleanly.
-    # Default is 72dpi. 
-    zoom = 3.0 # High res render
+    # Pick the zoom that lands on the target size, so MuPDF renders it in one pass
+    # (no 3x render + PIL copy + LANCZOS resize of a ~200MB page)
+    zoom = TARGET_LONG_SIDE / max(page.rect.width, page.rect.height)
     mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat)
-    
-    # 2. Convert to PIL
-    mode = "RGBA" if pix.alpha else "RGB"
-    img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-    if mode == "RGBA":
-        img = img.convert("RGB")
-        
-    # 3. Resize to optimal dimension (1288px max)
-    w, h = img.size
-    max_dim = max(w, h)
-    
-    # Check if we need to resize (up or down). 
-    # Actually, scaling DOWN is better than starting low and scaling up.
-    # We rendered at 3x, so it's likely huge (e.g. 1800-2400+).
-    
-    if max_dim != TARGET_LONG_SIDE:
-        ratio = TARGET_LONG_SIDE / max_dim
-        new_w = int(w * ratio)
-        new_h = int(h * ratio)
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB, alpha=False)
 
-    # 4. Save as PNG (Lossless)
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    if PAGE_IMAGE_FORMAT == "jpeg":
+        data = pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+    else:
+        data = pix.tobytes("png")
+    return base64.b64encode(data).decode('utf-8')
 
 def perform_ocr_on_page(base64_image, page_num):
     try:
@@ -79,7 +65,7 @@ def perform_ocr_on_page(base64_image, page_num):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
+                                "url": f"data:image/{PAGE_IMAGE_FORMAT};base64,{base64_image}"
                             }
                         }
                     ]
@@ -89,10 +75,11 @@ def perform_ocr_on_page(base64_image, page_num):
             "temperature": 0.0 # Strict extraction
         }
 
-        response = requests.post(LM_STUDIO_URL, headers=headers, json=payload)
+        # orjson encodes the base64 page straight to bytes (requests' json= goes str -> bytes)
+        response = _session.post(LM_STUDIO_URL, headers=headers, data=orjson.dumps(payload))
         response.raise_for_status()
         
-        result = response.json()
+        result = orjson.loads(response.content)
         content = result['choices'][0]['message']['content']
         return content
 
@@ -100,7 +87,16 @@ def perform_ocr_on_page(base64_image, page_num):
         print(f"Error OCRing page {page_num}: {e}")
         return None
 
-def process_pdf(pdf_path, output_dir, dry_run=False, overwrite=False):
+def add_page(full_transcription, page_num, future, page_count):
+    text = future.result()
+    if text:
+        full_transcription.append(f"## Page {page_num}\n\n{text}\n\n---\n")
+        print(f"  - Page {page_num}/{page_count}... Done.")
+    else:
+        full_transcription.append(f"## Page {page_num}\n\n[OCR Failed]\n\n---\n")
+        print(f"  - Page {page_num}/{page_count}... Failed.")
+
+def process_pdf(pdf_path, output_dir, dry_run=False, overwrite=False, workers=OCR_WORKERS):
     ocr_path = os.path.join(output_dir, "ocr.md")
     
     if os.path.exists(ocr_path) and not overwrite:
@@ -115,26 +111,27 @@ def process_pdf(pdf_path, output_dir, dry_run=False, overwrite=False):
             print("Empty PDF.")
             return
 
+        if dry_run:
+            for page_num in range(1, doc.page_count + 1):
+                print(f"  - Page {page_num}/{doc.page_count}... [Dry Run]")
+            doc.close()
+            return
+
         full_transcription = []
-        
-        for i, page in enumerate(doc):
-            page_num = i + 1
-            print(f"  - Page {page_num}/{doc.page_count}...", end="", flush=True)
-            
-            if dry_run:
-                print(" [Dry Run]")
-                continue
-
-            # Render & OCR
-            b64_img = get_page_image_base64(page)
-            text = perform_ocr_on_page(b64_img, page_num)
-            
-            if text:
-                full_transcription.append(f"## Page {page_num}\n\n{text}\n\n---\n")
-                print(" Done.")
-            else:
-                full_transcription.append(f"## Page {page_num}\n\n[OCR Failed]\n\n---\n")
-                print(" Failed.")
+        in_flight = deque() # (page_num, future), oldest first
+
+        # Render here while earlier pages are still at the model; pages are collected in order
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, page in enumerate(doc):
+                # Don't render further ahead than the workers can take
+                if len(in_flight) >= workers:
+                    add_page(full_transcription, *in_flight.popleft(), doc.page_count)
+
+                b64_img = get_page_image_base64(page)
+                in_flight.append((i + 1, executor.submit(perform_ocr_on_page, b64_img, i + 1)))
+
+            while in_flight:
+                add_page(full_transcription, *in_flight.popleft(), doc.page_count)
 
         doc.close()
 
@@ -150,9 +147,13 @@ def main():
     parser = argparse.ArgumentParser(description="Perform OCR on full PDF documents using LM Studio.")
     parser.add_argument("--dry-run", action="store_true", help="Print what would be processed without doing it.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing output files.")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help="Pages to OCR concurrently.")
     parser.add_argument("root_dir", nargs="?", default=ROOT_DIR, help="Root directory to scan.")
     args = parser.parse_args()
 
+    global _session
+    _session = new_session(max(args.workers, 1))
+
     abs_root = os.path.abspath(args.root_dir)
     if not os.path.exists(abs_root):
         print(f"Error: Directory '{abs_root}' not found.")
@@ -180,7 +181,7 @@ def main():
                 
                 # Check validation (must have info.json to be considered a 'document folder')
                 if target_dir and os.path.exists(os.path.join(target_dir, "info.json")):
-                    process_pdf(pdf_path, target_dir, dry_run=args.dry_run, overwrite=args.overwrite)
+                    process_pdf(pdf_path, target_dir, dry_run=args.dry_run, overwrite=args.overwrite, workers=args.workers)
                     count += 1
     
     print(f"Finished. Processed {count} PDFs.")
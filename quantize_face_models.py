@@ -0,0 +1,73 @@
+import os
+import shutil
+import logging
+import argparse
+try:
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+except ImportError:
+    quantize_dynamic = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Same layout FaceAnalysis uses: <root>/models/<name>/*.onnx
+MODELS_ROOT = ".insightface/models"
+SOURCE_MODEL = "buffalo_l"
+TARGET_MODEL = "buffalo_l_q"
+
+def quantize_model(src, dst):
+    # quant_pre_process runs the ORT graph optimizer first, which folds BatchNorm into the convs
+    prepped = dst + ".prep.onnx"
+    try:
+        quant_pre_process(src, prepped)
+        quantize_dynamic(prepped, dst, weight_type=QuantType.QInt8)
+    finally:
+        if os.path.exists(prepped):
+            os.remove(prepped)
+
+def main():
+    parser = argparse.ArgumentParser(description="One-time int8 quantization of the InsightFace buffalo_l models.")
+    parser.add_argument("--keep-genderage", action="store_true", help="Copy genderage.onnx unquantized (if its accuracy regresses)")
+    parser.add_argument("--overwrite", action="store_true", help="Re-quantize models that already exist")
+    args = parser.parse_args()
+
+    if quantize_dynamic is None:
+        logging.error("onnxruntime is not installed. Cannot quantize models.")
+        return
+
+    src_dir = os.path.join(MODELS_ROOT, SOURCE_MODEL)
+    dst_dir = os.path.join(MODELS_ROOT, TARGET_MODEL)
+    if not os.path.isdir(src_dir):
+        logging.error(f"{src_dir} not found. Run detect_faces.py once to download {SOURCE_MODEL}.")
+        return
+    os.makedirs(dst_dir, exist_ok=True)
+
+    for name in sorted(os.listdir(src_dir)):
+        if not name.endswith(".onnx"):
+            continue
+        src = os.path.join(src_dir, name)
+        dst = os.path.join(dst_dir, name)
+        if os.path.exists(dst) and not args.overwrite:
+            logging.info(f"Skipping {name}, already exists.")
+            continue
+
+        if args.keep_genderage and name == "genderage.onnx":
+            shutil.copyfile(src, dst)
+            logging.info(f"Copied {name} unquantized.")
+            continue
+
+        logging.info(f"Quantizing {name}...")
+        try:
+            quantize_model(src, dst)
+        except Exception as e:
+            # Fall back to the fp32 model so the set stays complete
+            logging.error(f"Failed to quantize {name} ({e}), copying fp32 version.")
+            shutil.copyfile(src, dst)
+            continue
+        logging.info(f"  {os.path.getsize(src) / 1e6:.1f} MB -> {os.path.getsize(dst) / 1e6:.1f} MB")
+
+    logging.info(f"Done. Use with: python detect_faces.py --model {TARGET_MODEL}")
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@ SEEDS = [
 ]
 OUTPUT_DIR = "epstein_files"
 INVENTORY_FILE = "epstein_files/inventory.json"
+PRETTY_INVENTORY_FILE = "epstein_files/inventory.pretty.json"
 
 # Set of visited URLs to avoid cycles
 visited_pages = set()
@@ -82,7 +83,13 @@ def is_valid_file_url(url):
     return path.lower().endswith(valid_exts)
 
 def save_inventory():
+    # Called after every download, so keep it compact; the pretty copy is written once per run
     with open(INVENTORY_FILE, 'w') as f:
+        json.dump(inventory, f, separators=(',', ':'))
+
+def save_pretty_inventory():
+    # Human-readable copy for browsing, never read back by the scripts
+    with open(PRETTY_INVENTORY_FILE, 'w') as f:
         json.dump(inventory, f, indent=2)
 
 def scrape_page(page, url):
@@ -370,6 +377,7 @@ def main():
                         if count % 5 == 0: save_inventory()
         
         save_inventory()
+        save_pretty_inventory()
         print(f"Retroactive compression complete. Processed {count} files.")
         return
 
@@ -450,5 +458,7 @@ def main():
             
         browser.close()
 
+    save_pretty_inventory()
+
 if __name__ == "__main__":
     main()